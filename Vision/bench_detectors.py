@@ -0,0 +1,359 @@
+"""Headless throughput benchmark for every detector in Vision/, on recorded video or synthetic frames.
+
+Run from the Vision directory (model paths default to the detectors' own):
+
+    python bench_detectors.py --out x86.json
+    python bench_detectors.py --video session.mp4 --sizes 640x480,1280x720 --threads 1,4 --out pi.json
+    python bench_detectors.py --detectors face,gesture --against pi.json
+
+Each (detector, size, threads) case runs in its own child process, so peak
+RSS is that detector's alone and `threads` can pin the child to that many
+CPUs (OpenCV and OpenMP pools are sized to match; MediaPipe has no thread
+setting of its own, the CPU affinity is what limits it). Frames are loaded
+and resized before timing starts, so only the detector is measured:
+preprocessing each script does per frame, inference and result decoding,
+but no drawing or display. Detectors whose dependency or model file is
+missing are reported as skipped.
+
+Haar, SSD and the emotion model do little work on frames with nothing in
+them; use --video with people in view for numbers that mean something.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import cv2
+
+# Frame sources and percentiles are shared with the Pi benchmarks
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "pi"))
+from latency_trace import percentile
+from synthetic_camera import parse_size, synthetic_frames, video_frames
+
+DETECTORS = ("face", "gesture", "mediapipe-object", "object-ident", "emotion", "blazepose", "posenet")
+
+MODELS = {
+    "face": "face-detector/detector.tflite",
+    "gesture": "gesture-recognition/gesture_recognizer.task",
+    "mediapipe-object": "Object-Animal-Detection/mediapipe-object/efficientdet.tflite",
+    "object-ident": "Object-Animal-Detection/frozen_inference_graph.pb",
+    "posenet": "Pose-Detection/graph_opt.pb",
+}
+SSD_CONFIG = "Object-Animal-Detection/ssd_mobilenet_v3_large_coco_2020_01_14.pbtxt"
+HAAR_CASCADE = "Emotion-Recognition/haarcascade_frontalface_default.xml"
+
+
+class Skip(Exception):
+    """The detector cannot run here (missing package or model file)."""
+
+
+def _require_file(path):
+    if not os.path.exists(path):
+        raise Skip(f"model file not found: {path}")
+    return path
+
+
+def _mediapipe():
+    try:
+        import mediapipe as mp
+    except ImportError:
+        raise Skip("mediapipe is not installed")
+    return mp
+
+
+# Each loader returns process(bgr_frame, timestamp_ms); the work mirrors the detector's script
+def load_face(model):
+    mp = _mediapipe()
+    from mediapipe.tasks import python
+    from mediapipe.tasks.python import vision
+    options = vision.FaceDetectorOptions(base_options=python.BaseOptions(model_asset_path=_require_file(model)),
+                                         running_mode=vision.RunningMode.VIDEO,
+                                         min_detection_confidence=0.5, min_suppression_threshold=0.5)
+    detector = vision.FaceDetector.create_from_options(options)
+
+    def process(frame, timestamp_ms):
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        result = detector.detect_for_video(mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb), timestamp_ms)
+        return len(result.detections)
+    return process
+
+
+def load_gesture(model):
+    mp = _mediapipe()
+    from mediapipe.tasks import python
+    from mediapipe.tasks.python import vision
+    options = vision.GestureRecognizerOptions(
+        base_options=python.BaseOptions(model_asset_path=_require_file(model)),
+        running_mode=vision.RunningMode.VIDEO, num_hands=2, min_hand_detection_confidence=0.5,
+        min_hand_presence_confidence=0.5, min_tracking_confidence=0.5)
+    recognizer = vision.GestureRecognizer.create_from_options(options)
+
+    def process(frame, timestamp_ms):
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        result = recognizer.recognize_for_video(mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb), timestamp_ms)
+        return len(result.gestures)
+    return process
+
+
+def load_mediapipe_object(model):
+    mp = _mediapipe()
+    from mediapipe.tasks import python
+    from mediapipe.tasks.python import vision
+    options = vision.ObjectDetectorOptions(base_options=python.BaseOptions(model_asset_path=_require_file(model)),
+                                           running_mode=vision.RunningMode.VIDEO,
+                                           max_results=5, score_threshold=0.25)
+    detector = vision.ObjectDetector.create_from_options(options)
+
+    def process(frame, timestamp_ms):
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        result = detector.detect_for_video(mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb), timestamp_ms)
+        return len(result.detections)
+    return process
+
+
+def load_object_ident(model):
+    net = cv2.dnn_DetectionModel(_require_file(model), _require_file(SSD_CONFIG))
+    net.setInputSize(320, 320)
+    net.setInputScale(1.0 / 127.5)
+    net.setInputMean((127.5, 127.5, 127.5))
+    net.setInputSwapRB(True)
+
+    def process(frame, timestamp_ms):
+        class_ids, _, _ = net.detect(frame, confThreshold=0.45, nmsThreshold=0.2)
+        return len(class_ids)
+    return process
+
+
+def load_emotion(model):
+    if not hasattr(cv2, "CascadeClassifier"):
+        raise Skip("this OpenCV build has no CascadeClassifier")
+    cascade_path = HAAR_CASCADE if os.path.exists(HAAR_CASCADE) else \
+        cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+    face_cascade = cv2.CascadeClassifier(cascade_path)
+    if face_cascade.empty():
+        raise Skip(f"Haar cascade not found: {cascade_path}")
+    try:
+        from deepface import DeepFace
+    except ImportError:
+        raise Skip("deepface is not installed")
+
+    def process(frame, timestamp_ms):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        rgb = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.05, minNeighbors=7, minSize=(30, 30))
+        for (x, y, w, h) in faces:
+            DeepFace.analyze(rgb[y:y + h, x:x + w], actions=['emotion'], enforce_detection=False, silent=True)
+        return len(faces)
+    return process
+
+
+def load_blazepose(model):
+    mp = _mediapipe()
+    pose = mp.solutions.pose.Pose(static_image_mode=False, min_detection_confidence=0.5,
+                                  min_tracking_confidence=0.5)
+
+    def process(frame, timestamp_ms):
+        result = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        return int(result.pose_landmarks is not None)
+    return process
+
+
+def load_posenet(model):
+    net = cv2.dnn.readNetFromTensorflow(_require_file(model))
+
+    def process(frame, timestamp_ms):
+        net.setInput(cv2.dnn.blobFromImage(frame, 1.0, (368, 368), (127.5, 127.5, 127.5), swapRB=True, crop=False))
+        out = net.forward()
+        found = 0
+        for i in range(19):  # BODY_PARTS in posenet.py
+            _, confidence, _, _ = cv2.minMaxLoc(out[0, i, :, :])
+            found += confidence > 0.3
+        return found
+    return process
+
+
+LOADERS = {
+    "face": load_face,
+    "gesture": load_gesture,
+    "mediapipe-object": load_mediapipe_object,
+    "object-ident": load_object_ident,
+    "emotion": load_emotion,
+    "blazepose": load_blazepose,
+    "posenet": load_posenet,
+}
+
+
+def run_case(case):
+    """Runs one benchmark case in this process and returns its result dict."""
+    threads = case["threads"]
+    if threads and hasattr(os, "sched_setaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, cpus[:threads])
+    if threads:
+        cv2.setNumThreads(threads)
+
+    size = tuple(case["size"])
+    result = {"detector": case["detector"], "size": f"{size[0]}x{size[1]}", "threads": threads}
+    try:
+        process = LOADERS[case["detector"]](case["model"])
+    except Skip as e:
+        return {**result, "skipped": str(e)}
+
+    total = case["warmup"] + case["frames"]
+    frames = video_frames(case["video"], size, min(total, case["clip"])) if case["video"] \
+        else synthetic_frames(size, min(total, case["clip"]))
+    frame_interval_ms = 1000 / case["source_fps"]
+
+    for i in range(case["warmup"]):
+        process(frames[i % len(frames)], int(i * frame_interval_ms))
+
+    latencies = []
+    detections = 0
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    for i in range(case["warmup"], total):
+        frame_start = time.perf_counter()
+        detections += process(frames[i % len(frames)], int(i * frame_interval_ms))
+        latencies.append((time.perf_counter() - frame_start) * 1000)
+    elapsed = time.perf_counter() - start
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu_seconds = (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime)
+    latencies.sort()
+    return {
+        **result,
+        "frames": len(latencies),
+        "fps": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3),
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p90": round(percentile(latencies, 0.90), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(latencies[-1], 3),
+        },
+        "cpu_percent": round(100 * cpu_seconds / elapsed, 1),  # 100 = one core busy
+        "peak_rss_mb": round(usage_end.ru_maxrss / 1024, 1),  # includes loading the model
+        "detections_per_frame": round(detections / len(latencies), 3),
+    }
+
+
+def run_in_child(case, timeout):
+    """Runs a case in a fresh interpreter so its memory and thread pools are its own."""
+    env = dict(os.environ)
+    if case["threads"]:
+        for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"):
+            env[name] = str(case["threads"])
+    label = {"detector": case["detector"], "size": "{}x{}".format(*case["size"]), "threads": case["threads"]}
+    try:
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)],
+                               capture_output=True, text=True, env=env, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {**label, "error": f"timed out after {timeout} s"}
+    lines = child.stdout.strip().splitlines()
+    if child.returncode != 0 or not lines:
+        return {**label, "error": (child.stderr.strip().splitlines() or ["no output"])[-1]}
+    return json.loads(lines[-1])
+
+
+def environment():
+    info = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+    }
+    try:
+        import mediapipe as mp
+        info["mediapipe"] = mp.__version__
+    except ImportError:
+        pass
+    try:
+        info["commit"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                        cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        pass
+    return info
+
+
+def compare(before, after):
+    """fps of matching cases in two reports, with the ratio after/before."""
+    key = lambda r: (r["detector"], r["size"], r["threads"])
+    previous = {key(r): r for r in before["results"] if "fps" in r}
+    rows = []
+    for r in after["results"]:
+        if "fps" in r and key(r) in previous:
+            old = previous[key(r)]["fps"]
+            rows.append({"detector": r["detector"], "size": r["size"], "threads": r["threads"],
+                         "fps_before": old, "fps_after": r["fps"],
+                         "ratio": round(r["fps"] / old, 3) if old else None})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--detectors', default=",".join(DETECTORS), help='Comma-separated detectors to run.')
+    parser.add_argument('--sizes', default="640x480,960x540,1280x720",
+                        help='Comma-separated frame sizes fed to each detector.')
+    parser.add_argument('--threads', default="0",
+                        help='Comma-separated CPU/thread counts per case (0 = leave at the default).')
+    parser.add_argument('--video', default=None, help='Recorded video to use instead of synthetic frames.')
+    parser.add_argument('--frames', type=int, default=200, help='Timed frames per case.')
+    parser.add_argument('--warmup', type=int, default=10, help='Untimed frames before timing starts.')
+    parser.add_argument('--clip', type=int, default=120,
+                        help='Distinct frames held in memory; longer runs loop over them.')
+    parser.add_argument('--sourceFps', type=float, default=30.0, help='Frame rate used for VIDEO-mode timestamps.')
+    parser.add_argument('--timeout', type=float, default=600.0, help='Seconds before a case is abandoned.')
+    for name, path in MODELS.items():
+        parser.add_argument(f'--{name}-model', default=path, help=f'Model file for {name}.')
+    parser.add_argument('--out', default=None, help='Write the JSON report here instead of stdout.')
+    parser.add_argument('--against', default=None, help='Earlier report to compare fps with.')
+    parser.add_argument('--case', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    detectors = [name.strip() for name in args.detectors.split(",") if name.strip()]
+    unknown = set(detectors) - set(DETECTORS)
+    if unknown:
+        parser.error(f"unknown detectors: {', '.join(sorted(unknown))} (choose from {', '.join(DETECTORS)})")
+    models = vars(args)
+
+    results = []
+    for detector in detectors:
+        for size in [parse_size(text) for text in args.sizes.split(",")]:
+            for threads in [int(text) for text in args.threads.split(",")]:
+                case = {"detector": detector, "size": size, "threads": threads,
+                        "model": models.get(f"{detector.replace('-', '_')}_model"),
+                        "video": args.video, "frames": args.frames, "warmup": args.warmup,
+                        "clip": args.clip, "source_fps": args.sourceFps}
+                result = run_in_child(case, args.timeout)
+                results.append(result)
+                status = result.get("skipped") or result.get("error") or \
+                    f"{result['fps']} fps, p50 {result['latency_ms']['p50']} ms, cpu {result['cpu_percent']}%"
+                print(f"{result['detector']:<17} {result['size']:>9} threads={threads}: {status}", file=sys.stderr)
+
+    report = {"environment": environment(), "source": args.video or "synthetic",
+              "frames": args.frames, "results": results}
+    if args.against:
+        with open(args.against) as f:
+            report["comparison"] = compare(json.load(f), report)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,7 @@
 """Main scripts to run face detector."""
 
 import argparse
+import os
 import sys
 import time
 
@@ -25,6 +26,12 @@ from mediapipe.tasks.python import vision
 
 from utils import visualize
 
+# Frame buffers come from the Pi pipeline's pool, so allocations can be counted
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pi"))
+from frame_pool import FramePool, allocation_report
+
+REPORT_INTERVAL = 10  # seconds between allocation/memory reports
+
 # Global variables to calculate FPS
 COUNTER, FPS = 0, 0
 START_TIME = time.time()
@@ -82,19 +89,50 @@ def run(model: str, min_detection_confidence: float,
   detector = vision.FaceDetector.create_from_options(options)
 
 
+  # Capture, mirror and RGB conversion write into pooled buffers instead of
+  # allocating new arrays for each frame. The camera may not honour the
+  # requested size, so the pools are sized from the first frame.
+  success, first_image = cap.read()
+  if not success:
+    sys.exit(
+        'ERROR: Unable to read from webcam. Please verify your webcam settings.'
+    )
+  capture_pool = FramePool(first_image.shape, size=1)
+  mirror_pool = FramePool(first_image.shape, size=1)
+  rgb_pool = FramePool(first_image.shape, size=1)
+  pools = (capture_pool, mirror_pool, rgb_pool)
+  frames = 0
+  report_time = time.time()
+
   # Continuously capture images from the camera and run inference
   while cap.isOpened():
-    success, image = cap.read()
+    captured = capture_pool.acquire()
+    success, image = cap.read(captured.array)
     if not success:
       sys.exit(
           'ERROR: Unable to read from webcam. Please verify your webcam settings.'
       )
-
-    image = cv2.flip(image, 1)
+    if image is not captured.array:
+      # The frame size changed, so OpenCV read into a new array instead of the
+      # pooled one: resize the pools to match (the old ones stay in the report)
+      captured.release()
+      capture_pool = FramePool(image.shape, size=1)
+      mirror_pool = FramePool(image.shape, size=1)
+      rgb_pool = FramePool(image.shape, size=1)
+      pools += (capture_pool, mirror_pool, rgb_pool)
+      captured = capture_pool.acquire()
+      captured.array[...] = image
+
+    mirrored = mirror_pool.acquire()
+    cv2.flip(captured.array, 1, dst=mirrored.array)
+    captured.release()
 
     # Convert the image from BGR to RGB as required by the TFLite model.
-    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_image)
+    rgb = rgb_pool.acquire()
+    cv2.cvtColor(mirrored.array, cv2.COLOR_BGR2RGB, dst=rgb.array)
+    # mp.Image holds its own copy of the pixels, so the RGB buffer goes straight back
+    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb.array)
+    rgb.release()
 
     # Run face detection using the model.
     detector.detect_async(mp_image, time.time_ns() // 1_000_000)
@@ -102,7 +140,7 @@ def run(model: str, min_detection_confidence: float,
     # Show the FPS
     fps_text = 'FPS = {:.1f}'.format(FPS)
     text_location = (left_margin, row_size)
-    current_frame = image
+    current_frame = mirrored.array
     cv2.putText(current_frame, fps_text, text_location, cv2.FONT_HERSHEY_DUPLEX,
                 font_size, text_color, font_thickness, cv2.LINE_AA)
 
@@ -111,11 +149,18 @@ def run(model: str, min_detection_confidence: float,
         current_frame = visualize(current_frame, DETECTION_RESULT)
 
     cv2.imshow('face_detection', current_frame)
+    mirrored.release()
+
+    frames += 1
+    if time.time() - report_time > REPORT_INTERVAL:
+      print(allocation_report(frames, pools))
+      report_time = time.time()
 
     # Stop the program if the ESC key is pressed.
     if cv2.waitKey(1) == 27:
       break
 
+  print(allocation_report(frames, pools))
   detector.close()
   cap.release()
   cv2.destroyAllWindows()
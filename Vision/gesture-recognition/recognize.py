@@ -14,6 +14,7 @@
 """Main scripts to run gesture recognition."""
 
 import argparse
+import os
 import sys
 import time
 
@@ -27,6 +28,12 @@ mp_hands = mp.solutions.hands
 mp_drawing = mp.solutions.drawing_utils
 mp_drawing_styles = mp.solutions.drawing_styles
 
+# Frame buffers come from the Pi pipeline's pool, so allocations can be counted
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pi"))
+from frame_pool import FramePool, allocation_report
+
+REPORT_INTERVAL = 10  # seconds between allocation/memory reports
+
 
 # Global variables to calculate FPS
 COUNTER, FPS = 0, 0
@@ -97,19 +104,54 @@ def run(model: str, num_hands: int,
                                           result_callback=save_result)
   recognizer = vision.GestureRecognizer.create_from_options(options)
 
+  # Capture, mirror and RGB conversion write into pooled buffers instead of
+  # allocating new arrays for each frame. The camera may not honour the
+  # requested size, so the pools are sized from the first frame. The mirror
+  # pool holds two: the last annotated frame stays on screen (shown) while
+  # the next one is prepared.
+  success, first_image = cap.read()
+  if not success:
+    sys.exit(
+        'ERROR: Unable to read from webcam. Please verify your webcam settings.'
+    )
+  capture_pool = FramePool(first_image.shape, size=1)
+  mirror_pool = FramePool(first_image.shape, size=2)
+  rgb_pool = FramePool(first_image.shape, size=1)
+  pools = (capture_pool, mirror_pool, rgb_pool)
+  shown = None
+  frames = 0
+  report_time = time.time()
+
   # Continuously capture images from the camera and run inference
   while cap.isOpened():
-    success, image = cap.read()
+    captured = capture_pool.acquire()
+    success, image = cap.read(captured.array)
     if not success:
       sys.exit(
           'ERROR: Unable to read from webcam. Please verify your webcam settings.'
       )
-
-    image = cv2.flip(image, 1)
+    if image is not captured.array:
+      # The frame size changed, so OpenCV read into a new array instead of the
+      # pooled one: resize the pools to match (the old ones stay in the report)
+      captured.release()
+      capture_pool = FramePool(image.shape, size=1)
+      mirror_pool = FramePool(image.shape, size=2)
+      rgb_pool = FramePool(image.shape, size=1)
+      pools += (capture_pool, mirror_pool, rgb_pool)
+      captured = capture_pool.acquire()
+      captured.array[...] = image
+
+    mirrored = mirror_pool.acquire()
+    cv2.flip(captured.array, 1, dst=mirrored.array)
+    captured.release()
+    image = mirrored.array
 
     # Convert the image from BGR to RGB as required by the TFLite model.
-    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_image)
+    rgb = rgb_pool.acquire()
+    cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=rgb.array)
+    # mp.Image holds its own copy of the pixels, so the RGB buffer goes straight back
+    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb.array)
+    rgb.release()
 
     # Run gesture recognizer using the model.
     recognizer.recognize_async(mp_image, time.time_ns() // 1_000_000)
@@ -176,16 +218,28 @@ def run(model: str, num_hands: int,
           mp_drawing_styles.get_default_hand_landmarks_style(),
           mp_drawing_styles.get_default_hand_connections_style())
 
+      # Keep this buffer on screen until the next result replaces it
+      mirrored.retain()
+      if shown is not None:
+        shown.release()
+      shown = mirrored
       recognition_frame = current_frame
       recognition_result_list.clear()
 
     if recognition_frame is not None:
         cv2.imshow('gesture_recognition', recognition_frame)
+    mirrored.release()
+
+    frames += 1
+    if time.time() - report_time > REPORT_INTERVAL:
+      print(allocation_report(frames, pools))
+      report_time = time.time()
 
     # Stop the program if the ESC key is pressed.
     if cv2.waitKey(1) == 27:
         break
 
+  print(allocation_report(frames, pools))
   recognizer.close()
   cap.release()
   cv2.destroyAllWindows()
@@ -5,25 +5,27 @@
 # Notes:
 # This has been tested on a Mac for now, it will later be shifted to a Rapsberry Pi.
 
+import os
+import sys
 import time
 import cv2
 import mediapipe as mp
 from mediapipe.tasks import python
 from mediapipe.tasks.python import vision
 from mediapipe.framework.formats import landmark_pb2
-import serial
-import time
+
+# Shared Pi <-> Arduino serial protocol helper lives with the Pi scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pi"))
+from serial_link import SerialLink
+
+# The sketch only accepts named commands (KNOWN_COMMANDS in arduino.ino) and
+# NACKs the old numeric ones; the names match what interaction_fsm.py sends
+# in the same situations.
 
 # Serial to connect to the Raspberry Pi
-# ser = serial.Serial("/dev/ttyACM0", 115200, timeout=1)
-# Serial to connect to the MacBook
-ser = serial.Serial("/dev/tty.usbmodem11301", 115200, timeout=1)
-# Vairables for pyserial
-ser.setDTR(False)
-time.sleep(1)
-ser.flushInput()
-ser.setDTR(True)
-time.sleep(2)
+# link = SerialLink.open("/dev/ttyACM0", 115200)
+# Serial to connect to the MacBook (NOMO_SERIAL_PORT can point at a virtual_arduino.py pty instead)
+link = SerialLink.open(os.environ.get("NOMO_SERIAL_PORT", "/dev/tty.usbmodem11301"), 115200)
 
 # Global Variables
 FACE_DETECTION_RESULT = None
@@ -136,40 +138,37 @@ def run(face_model: str, gesture_model: str, camera_id: int, width: int, height:
                 # Someone is hiding?
                 elif gesture_detected:
                     print(f"\n{gesture_detected} detected. Where's your face human? \nAre you a ghost?")
-                    ser.write(b'7') # send the command to arduino
+                    link.send(b'LOOKUP') # send the command to arduino
                     alone_timer_start = None
 
                 # Check if 10 seconds have elapsed since the "alone" timer started
                 elif alone_timer_start is not None and time.time() - alone_timer_start > 10:
                     print("\nWhere's everyone? \nI need people! Talk to me!")
-                    ser.write(b'1') # send the command to arduino
+                    link.send(b'STANDBY') # send the command to arduino
                     alone_timer_start = None  # Reset the timer once the message is displayed
             else:
                 # Reset the "alone" timer once people are detected
                 alone_timer_start = None
                 if num_people >= 3:
                     print(f"{num_people} people detected! \nMoving back and closing eyes.")
-                    ser.write(b'2') # send the command to arduino
+                    link.send(b'SHY') # send the command to arduino
                 elif (num_people < 3 and num_people > 0) and gesture_detected == "Open_Palm":
                     print(f"{num_people} people detected with an open palm! \nWaving Back! Hii!")
-                    # ser.write(b'4') # send the command to arduino
-                    ser.flushInput()  # Clear input buffer
-                    ser.write(b'4')   # Send the command
-                    ser.flush()       # Ensure the command is sent immediately
+                    link.send(b'WAVE') # send the command to arduino
                 elif (num_people < 3 and num_people > 0) and gesture_detected == "Thumb_Up":
                     print(f"{num_people} people detected with a thumbs-up! \nCheers!")
-                    ser.write(b'5') # send the command to arduino
+                    link.send(b'DETECTED') # send the command to arduino
                 elif (num_people < 3 and num_people > 0) and gesture_detected == "Closed_Fist":
                     if closed_fist_counter == 1:
                         print(f"Starting desk mode!")
-                        ser.write(b'6') # send the command to arduino
+                        link.send(b'MOVE_TO_DESK') # send the command to arduino
                         closed_fist_counter = 0
                     else:
                         print(f"{num_people} people detected with closed fist. \nChecking for desk mode.")
                         closed_fist_counter += 1
                 elif num_people > 0:
                     print(f"{num_people} people detected. Awaiting interaction...")
-                    ser.write(b'3') # send the command to arduino
+                    link.send(b'NEUTRAL') # send the command to arduino
                 else:
                     continue
             LOG_TIMER = time.time()
@@ -67,6 +67,8 @@ def run(face_model: str, gesture_model: str, camera_id: int, width: int, height:
     update_interval = 2  # Interval for logging and actions in seconds
     closed_fist_counter = 0 # Interval for hold for desk mode
 
+    rgb_frame = None  # Reused RGB buffer, so the conversion does not allocate every frame
+
     while cap.isOpened():
         success, frame = cap.read()
         if not success:
@@ -80,7 +82,7 @@ def run(face_model: str, gesture_model: str, camera_id: int, width: int, height:
             continue
 
         frame = cv2.flip(frame, 1)  # Flip for a mirrored view
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_frame)
         mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
 
         # Run Face Detection
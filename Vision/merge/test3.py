@@ -68,6 +68,8 @@ def run(face_model: str, gesture_model: str, camera_id: int, width: int, height:
     closed_fist_counter = 0 # Interval for hold for desk mode
     alone_timer_start = 0 # Interval to display that it's lonely
 
+    rgb_frame = None  # Reused RGB buffer, so the conversion does not allocate every frame
+
     while cap.isOpened():
         success, frame = cap.read()
         if not success:
@@ -81,7 +83,7 @@ def run(face_model: str, gesture_model: str, camera_id: int, width: int, height:
             continue
 
         frame = cv2.flip(frame, 1)  # Flip for a mirrored view
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_frame)
         mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
 
         # Run Face Detection
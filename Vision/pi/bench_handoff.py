@@ -0,0 +1,80 @@
+"""Per-frame cost of handing a camera frame to MediaPipe, before and after buffer reuse.
+
+Runs on synthetic frames, so no camera is needed:
+
+    python bench_handoff.py --frames 500 --main 960x540 --lores 384x216
+
+Allocations are measured with tracemalloc (numpy/OpenCV arrays are tracked),
+reported as bytes and as full-size frame allocations per frame.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from synthetic_camera import parse_size
+
+
+def measure(name, convert, frames, frame_bytes):
+    convert()  # warm up (first call may allocate the reused buffer)
+
+    tracemalloc.start()
+    allocated = 0
+    start = time.perf_counter()
+    for _ in range(frames):
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = convert()
+        allocated += tracemalloc.get_traced_memory()[1] - baseline
+        del result
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    per_frame = allocated / frames
+    print(f"{name:<34} {elapsed / frames * 1000:8.3f} ms/frame "
+          f"{per_frame / 1024:10.1f} KiB/frame {per_frame / frame_bytes:6.2f} frame allocs/frame")
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--frames', type=int, default=500, help='Frames per measurement.')
+    parser.add_argument('--main', type=parse_size, default=(960, 540), help='Display stream size.')
+    parser.add_argument('--lores', type=parse_size, default=(384, 216), help='Inference stream size.')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    width, height = args.main
+    main_frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    lores_width, lores_height = args.lores
+    lores_yuv = rng.integers(0, 256, (lores_height * 3 // 2, lores_width), dtype=np.uint8)
+    lores_rgb = rng.integers(0, 256, (lores_height, lores_width, 3), dtype=np.uint8)
+
+    main_dst = np.empty_like(main_frame)
+    lores_dst = np.empty((lores_height, lores_width, 3), dtype=np.uint8)
+
+    print(f"main {width}x{height}, lores {lores_width}x{lores_height}, {args.frames} frames")
+    measure("before: main cvtColor (new array)",
+            lambda: cv2.cvtColor(main_frame, cv2.COLOR_BGR2RGB), args.frames, main_frame.nbytes)
+    measure("after:  main cvtColor (reused dst)",
+            lambda: cv2.cvtColor(main_frame, cv2.COLOR_BGR2RGB, dst=main_dst), args.frames, main_frame.nbytes)
+    measure("before: lores YUV420 (new array)",
+            lambda: cv2.cvtColor(lores_yuv, cv2.COLOR_YUV2RGB_I420), args.frames, lores_dst.nbytes)
+    measure("after:  lores YUV420 (reused dst)",
+            lambda: cv2.cvtColor(lores_yuv, cv2.COLOR_YUV2RGB_I420, dst=lores_dst), args.frames, lores_dst.nbytes)
+    measure("after:  lores RGB byte order (none)",
+            lambda: lores_rgb, args.frames, lores_dst.nbytes)
+
+    try:
+        import mediapipe as mp
+    except ImportError:
+        return
+    # mp.Image copies the pixels in C++, which tracemalloc cannot see; report the time only
+    measure("mp.Image wrap of lores RGB",
+            lambda: mp.Image(image_format=mp.ImageFormat.SRGB, data=lores_rgb), args.frames, lores_dst.nbytes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Serial command throughput and latency against the virtual Arduino (no hardware needed).
+
+    python bench_serial.py --count 1000 --latency 0.5
+
+Reports ACK round trips for back-to-back SerialLink.send() calls, and the
+queue-to-ACK latency of commands going through the CommandDispatcher.
+Pass --port to run the same measurement against a real board.
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import deque
+
+from command_dispatcher import CommandDispatcher
+from latency_trace import percentile
+from serial_link import SerialLink
+from virtual_arduino import VirtualArduino
+
+# Commands that do not make the sketch block in a servo routine
+COMMANDS = (b'PING', b'NEUTRAL', b'SHY', b'LOOK_LEFT', b'LOOK_RIGHT', b'STANDBY', b'CHECK_LOCATION')
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    pick = lambda q: round(percentile(values, q), 3)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(values[-1], 3)}
+
+
+def bench_link(link, count):
+    round_trips = []
+    start = time.perf_counter()
+    for i in range(count):
+        round_trip_ms = link.send(COMMANDS[i % len(COMMANDS)])
+        if round_trip_ms is not None:
+            round_trips.append(round_trip_ms)
+    elapsed = time.perf_counter() - start
+    return {"commands": count, "acked": len(round_trips),
+            "commands_per_s": round(count / elapsed, 1), "round_trip_ms": percentiles(round_trips)}
+
+
+def bench_dispatcher(link, count):
+    # Queue-to-ACK: time from dispatcher.send() until the board's ACK is read
+    queued = deque()
+    acked = []
+    done = threading.Event()
+    original_send = link.send
+
+    def timed_send(command):
+        round_trip_ms = original_send(command)
+        acked.append((time.perf_counter() - queued.popleft()) * 1000)
+        if len(acked) == count:
+            done.set()
+        return round_trip_ms
+
+    link.send = timed_send
+    dispatcher = CommandDispatcher(link).start()
+    start = time.perf_counter()
+    for i in range(count):
+        queued.append(time.perf_counter())
+        dispatcher.send(COMMANDS[i % len(COMMANDS)])
+    done.wait(timeout=count * 0.1 + 5)
+    elapsed = time.perf_counter() - start
+    dispatcher.stop()
+    link.send = original_send
+    return {"commands": count, "acked": len(acked),
+            "commands_per_s": round(len(acked) / elapsed, 1), "queue_to_ack_ms": percentiles(acked)}
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--count', type=int, default=500, help='Commands per measurement.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Virtual board reply latency in milliseconds.')
+    parser.add_argument('--port', default=None, help='Use a real board on this port instead.')
+    args = parser.parse_args()
+
+    board = None
+    if args.port is None:
+        board = VirtualArduino(latency=args.latency / 1000, simulate_blocking=False).start()
+        board.set_location("BLUE")
+    link = SerialLink.open(args.port or board.port)
+
+    report = {"port": args.port or "virtual", "link": bench_link(link, args.count)}
+    report["dispatcher"] = bench_dispatcher(link, args.count)
+    print(json.dumps(report, indent=2))
+
+    link.close()
+    if board is not None:
+        board.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,418 @@
+"""MJPEG load test: how many /nomo viewers the Pi serves before the detection loop starves.
+
+Opens N concurrent multipart/x-mixed-replace readers, some of them slow
+(a capped read rate and a small socket buffer, like a viewer on bad Wi-Fi),
+in steps of increasing client counts. For each step it reports delivered
+fps per client, frame age at receipt (from the X-Timestamp part header),
+throughput, the server's CPU and, from /metrics, capture and inference rates,
+so the step with no viewers is the baseline the others are compared with.
+
+With --launch the server is started here on a synthetic camera and a
+virtual_arduino.py board, so the test runs on any Linux box:
+
+    python bench_stream.py --launch piarduino_merge.py --clients 0,1,4,8,16 --slow 2 --out load.json
+    python bench_stream.py --launch stream2.py --url http://127.0.0.1:5000/video_feed --clients 1,4
+    python bench_stream.py --url http://pi.local:5000/nomo --pid 1234   # a server that is already running
+
+--framing instead measures the cost of writing multipart parts themselves:
+throughput and bytes copied per frame when writing a JPEG of --size to a
+local socket joined into one buffer (the old way), as separate writes (the
+WSGI body) and as one vectored sendmsg():
+
+    python bench_stream.py --framing --size 1280x720
+
+The load generator shares the machine with the server when both run on
+one box; its own CPU use is reported as client_cpu_percent.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlsplit
+
+import cv2
+
+from frame_broadcast import TIERS, TRAILER, part_header, send_vectored
+from latency_trace import percentile
+from synthetic_camera import parse_size, synthetic_frames
+from virtual_arduino import VirtualArduino
+
+BOUNDARY = b'--frame'
+
+
+class StreamClient:
+    """One MJPEG viewer on its own thread; records every frame it receives.
+
+    read_rate: bytes/s the viewer reads at (None = as fast as possible).
+    recv_buffer: SO_RCVBUF for the socket, so a slow reader pushes back on
+    the server within a few frames instead of a few megabytes.
+    """
+
+    def __init__(self, url, read_rate=None, recv_buffer=None, chunk=16384):
+        self.url = urlsplit(url)
+        self.read_rate = read_rate
+        self.recv_buffer = recv_buffer
+        self.chunk = chunk
+        self.slow = read_rate is not None
+
+        self._running = False
+        self._thread = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self.frames = []  # (receipt time.time(), X-Timestamp or None, JPEG size in bytes)
+        self.bytes = 0
+        self.error = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="StreamClient", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        sock = self._conn.sock if self._conn is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)  # unblocks the reader
+            except OSError:
+                pass  # already closed by the server
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def take(self):
+        """Frames and bytes received since the last take()."""
+        with self._lock:
+            frames, self.frames = self.frames, []
+            received, self.bytes = self.bytes, 0
+        return frames, received
+
+    def _run(self):
+        conn = self._conn = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=10)
+        try:
+            conn.connect()
+            if self.recv_buffer:
+                conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer)
+            conn.request("GET", self.url.path or "/")
+            response = conn.getresponse()
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}")
+            self._read_parts(response)
+        except Exception as e:  # reported per client; the run goes on
+            if self._running:
+                self.error = f"{type(e).__name__}: {e}"
+        finally:
+            conn.close()
+
+    def _read_parts(self, response):
+        buffer = b''
+        start = time.monotonic()
+        read = 0
+        while self._running:
+            data = response.read1(self.chunk)
+            if not data:
+                raise RuntimeError("stream ended")
+            read += len(data)
+            with self._lock:
+                self.bytes += len(data)
+            if self.read_rate:
+                # Stay under read_rate bytes/s on average, like a congested link
+                ahead = read / self.read_rate - (time.monotonic() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+            buffer += data
+            buffer = self._parse(buffer)
+
+    def _parse(self, buffer):
+        while True:
+            begin = buffer.find(BOUNDARY)
+            if begin < 0:
+                return buffer[-len(BOUNDARY):]
+            header_end = buffer.find(b'\r\n\r\n', begin)
+            if header_end < 0:
+                return buffer[begin:]
+            headers = {}
+            for line in buffer[begin + len(BOUNDARY):header_end].split(b'\r\n'):
+                name, _, value = line.partition(b':')
+                if value:
+                    headers[name.strip().lower()] = value.strip()
+            body_start = header_end + 4
+            if b'content-length' in headers:
+                body_end = body_start + int(headers[b'content-length'])
+                if len(buffer) < body_end:
+                    return buffer[begin:]
+            else:
+                body_end = buffer.find(b'\r\n' + BOUNDARY, body_start)
+                if body_end < 0:
+                    return buffer[begin:]
+            stamp = headers.get(b'x-timestamp')
+            with self._lock:
+                self.frames.append((time.time(), float(stamp) if stamp else None, body_end - body_start))
+            buffer = buffer[body_end:]
+
+
+def cpu_seconds(pid):
+    """utime + stime of a process, and its thread count, from /proc."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    return (int(fields[11]) + int(fields[12])) / ticks, int(fields[17])
+
+
+def scrape(url):
+    """Samples of a Prometheus text page as {(name, labels): value}; {} if unreachable."""
+    parts = urlsplit(url)
+    try:
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=5)
+        conn.request("GET", parts.path)
+        response = conn.getresponse()
+        text = response.read().decode() if response.status == 200 else ""
+        conn.close()
+    except OSError:
+        return {}
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        key, _, value = line.rpartition(" ")
+        name, _, labels = key.partition("{")
+        samples[(name, labels.rstrip("}"))] = float(value)
+    return samples
+
+
+def spread(values):
+    values = sorted(values)
+    if not values:
+        return None
+    pick = lambda q: round(percentile(values, q), 2)
+    return {"min": round(values[0], 2), "p50": pick(0.5), "p95": pick(0.95), "max": round(values[-1], 2)}
+
+
+def run_step(args, count, slow, pid):
+    clients = [StreamClient(args.url, read_rate=args.slowRate * 1024 if i < slow else None,
+                            recv_buffer=args.slowBuffer * 1024 if i < slow else None).start()
+               for i in range(count)]
+    time.sleep(args.warmup)
+    for client in clients:
+        client.take()
+
+    before = scrape(args.metrics)
+    cpu_before = cpu_seconds(pid) if pid else None
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.monotonic()
+    time.sleep(args.duration)
+    elapsed = time.monotonic() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_after = cpu_seconds(pid) if pid else None
+    after = scrape(args.metrics)
+
+    received = [client.take() for client in clients]
+    for client in clients:
+        client.stop()
+
+    def rate(name, labels=""):
+        key = (name, labels)
+        if key not in before or key not in after:
+            return None
+        return round((after[key] - before[key]) / elapsed, 2)
+
+    def kind_stats(is_slow):
+        frames = [frames for client, (frames, _) in zip(clients, received) if client.slow == is_slow]
+        if not frames:
+            return None
+        ages = [(receipt - stamp) * 1000 for client_frames in frames for receipt, stamp, _ in client_frames
+                if stamp is not None]
+        sizes = [size / 1024 for client_frames in frames for _, _, size in client_frames]
+        return {
+            "clients": len(frames),
+            "fps": spread([len(client_frames) / elapsed for client_frames in frames]),
+            "frame_age_ms": spread(ages),
+            "frame_kib": spread(sizes),
+        }
+
+    step = {
+        "clients": count,
+        "slow_clients": slow,
+        "fast": kind_stats(False),
+        "slow": kind_stats(True),
+        "mbit_s": round(sum(received_bytes for _, received_bytes in received) * 8 / elapsed / 1e6, 2),
+        "errors": [client.error for client in clients if client.error],
+        "client_cpu_percent": round(100 * ((usage_after.ru_utime - usage_before.ru_utime)
+                                           + (usage_after.ru_stime - usage_before.ru_stime)) / elapsed, 1),
+    }
+    if pid:
+        step["server_cpu_percent"] = round(100 * (cpu_after[0] - cpu_before[0]) / elapsed, 1)
+        step["server_threads"] = cpu_after[1]
+    if after:
+        step["capture_fps"] = rate("nomo_frames_captured_total")
+        step["inference_fps"] = after.get(("nomo_inference_fps", ""))
+        step["model_fps"] = {model: rate("nomo_inference_results_total", f'model="{model}"')
+                             for model in ("face", "gesture")}
+        step["frames_dropped_per_s"] = rate("nomo_frames_dropped_total")
+        encodes = rate("nomo_jpeg_encode_seconds_count")
+        step["jpeg_encodes_per_s"] = encodes
+        if encodes:
+            step["jpeg_encode_ms"] = round(1000 * rate("nomo_jpeg_encode_seconds_sum") / encodes, 2)
+    return step
+
+
+def bench_framing(size, frames):
+    """Throughput and per-frame copies of three ways to write one multipart part to a socket."""
+    _, encoded = cv2.imencode('.jpg', synthetic_frames(size, 1)[0], [cv2.IMWRITE_JPEG_QUALITY, TIERS[0].quality])
+    jpeg = encoded.tobytes()
+    header = part_header(len(jpeg), time.time())
+    methods = {
+        # What the stream did before: a fresh bytes of the JPEG, then header + JPEG + trailer joined
+        "joined": lambda sock: sock.sendall(header + encoded.tobytes() + TRAILER),
+        "separate_writes": lambda sock: [sock.sendall(buffer) for buffer in (header, jpeg, TRAILER)],
+        "sendmsg": lambda sock: send_vectored(sock, (header, jpeg, TRAILER)),
+    }
+
+    results = {"size": f"{size[0]}x{size[1]}", "jpeg_bytes": len(jpeg)}
+    for name, write in methods.items():
+        sender, receiver = socket.socketpair()
+        drained = threading.Thread(target=lambda: _drain(receiver), daemon=True)
+        drained.start()
+        for _ in range(10):
+            write(sender)
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            write(sender)
+        elapsed = time.perf_counter() - start
+
+        # Copies show up as allocations the size of the JPEG (tracemalloc sees bytes objects)
+        tracemalloc.start()
+        copied = 0
+        for _ in range(min(frames, 200)):
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            write(sender)
+            copied += tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+
+        sender.close()
+        drained.join(timeout=5)
+        results[name] = {
+            "frames_per_s": round(frames / elapsed, 1),
+            "mb_per_s": round(frames * (len(header) + len(jpeg) + len(TRAILER)) / elapsed / 1e6, 1),
+            "bytes_copied_per_frame": round(copied / min(frames, 200)),
+        }
+    return results
+
+
+def _drain(sock):
+    buffer = bytearray(1 << 20)
+    while sock.recv_into(buffer):
+        pass
+    sock.close()
+
+
+def write_report(report, path):
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def launch(args):
+    """Start the server on a synthetic camera and a virtual board; returns (process, board)."""
+    board = VirtualArduino().start()
+    env = dict(os.environ, NOMO_CAMERA=args.video or "synthetic", NOMO_SERIAL_PORT=board.port)
+    if args.faceModel:
+        env["NOMO_FACE_MODEL"] = os.path.abspath(args.faceModel)
+    if args.gestureModel:
+        env["NOMO_GESTURE_MODEL"] = os.path.abspath(args.gestureModel)
+    here = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen([sys.executable, os.path.join(here, args.launch)], cwd=here, env=env,
+                              stdout=subprocess.DEVNULL if not args.serverOutput else None,
+                              stderr=subprocess.DEVNULL if not args.serverOutput else None)
+    url = urlsplit(args.url)
+    deadline = time.monotonic() + args.startTimeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"ERROR: {args.launch} exited with code {server.returncode} (try --serverOutput).")
+        try:
+            socket.create_connection((url.hostname, url.port or 80), timeout=1).close()
+            # The pipeline starts with the server; give the camera and models a moment
+            time.sleep(args.warmup)
+            return server, board
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    sys.exit(f"ERROR: {args.launch} did not start listening within {args.startTimeout} s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000/nomo', help='MJPEG stream to load.')
+    parser.add_argument('--metrics', default=None, help='Prometheus endpoint (default: /metrics on the same host).')
+    parser.add_argument('--clients', default='0,1,2,4,8', help='Comma-separated client counts, one step each.')
+    parser.add_argument('--slow', type=int, default=1, help='Slow readers among the clients of each step.')
+    parser.add_argument('--slowRate', type=float, default=200.0, help='Read rate of slow clients in KiB/s.')
+    parser.add_argument('--slowBuffer', type=int, default=16, help='Socket receive buffer of slow clients in KiB.')
+    parser.add_argument('--duration', type=float, default=10.0, help='Measured seconds per step.')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Seconds before measuring each step.')
+    parser.add_argument('--pid', type=int, default=None, help='Server process to measure CPU of.')
+    parser.add_argument('--launch', default=None, help='Start this app (piarduino_merge.py, stream2.py) here first.')
+    parser.add_argument('--video', default=None, help='With --launch: camera plays this file instead of synthetic frames.')
+    parser.add_argument('--faceModel', default=None, help='With --launch: face detector model (NOMO_FACE_MODEL).')
+    parser.add_argument('--gestureModel', default=None, help='With --launch: gesture model (NOMO_GESTURE_MODEL).')
+    parser.add_argument('--startTimeout', type=float, default=60.0, help='Seconds to wait for the launched server.')
+    parser.add_argument('--serverOutput', action='store_true', help='Show the launched server\'s output.')
+    parser.add_argument('--framing', action='store_true', help='Benchmark multipart framing on a local socket only.')
+    parser.add_argument('--size', type=parse_size, default=(1280, 720), help='With --framing: frame size.')
+    parser.add_argument('--frames', type=int, default=2000, help='With --framing: parts written per method.')
+    parser.add_argument('--out', default=None, help='Write the JSON report here instead of stdout.')
+    args = parser.parse_args()
+
+    if args.framing:
+        write_report(bench_framing(args.size, args.frames), args.out)
+        return
+
+    url = urlsplit(args.url)
+    args.metrics = args.metrics or f"{url.scheme}://{url.netloc}/metrics"
+    server = board = None
+    if args.launch:
+        server, board = launch(args)
+        args.pid = server.pid
+
+    steps = []
+    try:
+        for count in [int(text) for text in args.clients.split(",")]:
+            step = run_step(args, count, min(args.slow, count), args.pid)
+            steps.append(step)
+            fast = step["fast"]["fps"]["p50"] if step["fast"] else None
+            print(f"{count:3d} clients ({step['slow_clients']} slow): fast fps p50 {fast}, "
+                  f"server cpu {step.get('server_cpu_percent')}%, inference fps {step.get('inference_fps')}",
+                  file=sys.stderr)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        if board is not None:
+            board.stop()
+
+    baseline = next((step.get("inference_fps") for step in steps if step["clients"] == 0), None)
+    if baseline:
+        for step in steps:
+            if step.get("inference_fps") is not None:
+                step["inference_vs_no_clients"] = round(step["inference_fps"] / baseline, 3)
+
+    report = {"url": args.url, "launched": args.launch, "source": (args.video or "synthetic") if args.launch else None,
+              "cpus": os.cpu_count(), "steps": steps}
+    write_report(report, args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Robot command queue that runs on its own thread, so the vision loop never blocks on the Arduino."""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+from serial_link import AckEvent, LocationEvent
+
+
+class CommandDispatcher:
+    """Sends queued commands over a SerialLink from a background thread.
+
+    send() only queues a command and returns immediately. A command can be
+    delayed, can hold back the commands queued after it (e.g. while the robot
+    plays its DETECTED animation), and request() passes the board's reply to a
+    callback as soon as the link's reader thread receives it.
+    """
+
+    def __init__(self, link, poll_interval=0.05, reply_timeout=1.0, tracer=None):
+        self.link = link
+        self.tracer = tracer  # LatencyTracer: marks "written"/"acked" on the command's trace
+        self.poll_interval = poll_interval  # longest sleep between checks for expired replies
+        self.reply_timeout = reply_timeout
+
+        self._cond = threading.Condition()
+        self._queue = []  # heap of (due, order, command, hold, then, trace)
+        self._order = itertools.count()
+        self._hold_until = 0.0
+        self._awaiting = deque()  # (deadline, then) for requests still waiting on a reply
+        self._running = False
+        self._thread = None
+        link.subscribe(self._on_event)
+
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="CommandDispatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    @property
+    def pending(self):
+        """Commands queued and not yet written."""
+        return len(self._queue)
+
+    def send(self, command, delay=0.0, hold=0.0, trace=None):
+        """Queue a command `delay` seconds from now; nothing queued after it goes out for `hold` seconds.
+
+        `trace` is the latency trace (frame timestamp) the command was decided on, if any.
+        """
+        self._push(command, delay, hold, None, trace)
+
+    def request(self, command, then, delay=0.0, hold=0.0):
+        """Queue a command and call then(reply) with the next line the board sends (None on timeout).
+
+        `then` runs on the link's reader thread when the reply arrives, or on
+        the dispatcher thread with None on timeout. Keep it short, and lock or
+        queue anything it shares with other threads.
+        """
+        self._push(command, delay, hold, then, None)
+
+    def sequence(self, steps):
+        """Queue (command, delay) steps in order, each `delay` seconds after the previous one."""
+        total = 0.0
+        for command, delay in steps:
+            total += delay
+            self._push(command, total, 0.0, None, None)
+
+    def _push(self, command, delay, hold, then, trace):
+        with self._cond:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._order), command, hold, then, trace))
+            self._cond.notify()
+
+    def _next_due(self):
+        # Pop the next command if it is due, else return how long to wait for it
+        now = time.monotonic()
+        if self._queue:
+            ready_at = max(self._queue[0][0], self._hold_until)
+            if ready_at <= now:
+                return heapq.heappop(self._queue), 0.0
+            return None, min(ready_at - now, self.poll_interval)
+        return None, self.poll_interval
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                item, wait = self._next_due()
+                if item is None:
+                    self._cond.wait(wait)
+                    item, _ = self._next_due()
+
+            if item is not None:
+                _, _, command, hold, then, trace = item
+                if then is not None:
+                    # Registered before sending, as the reply can beat the ACK wait.
+                    # Later commands keep flowing while the reply is on its way.
+                    with self._cond:
+                        self._awaiting.append((time.monotonic() + self.reply_timeout, then))
+                written_ns = time.monotonic_ns()
+                round_trip_ms = self.link.send(command)
+                if round_trip_ms is not None:
+                    print(f"Sent to Arduino: {command} (ACK in {round_trip_ms:.1f} ms)")
+                if self.tracer is not None and trace is not None:
+                    self.tracer.mark(trace, "written", written_ns)
+                    if round_trip_ms is not None:
+                        self.tracer.mark(trace, "acked", written_ns + int(round_trip_ms * 1e6))
+                if hold:
+                    self._hold_until = time.monotonic() + hold
+
+            self._expire_replies()
+
+    def _on_event(self, event):
+        # Reader thread: the first non-ACK line after a request is its reply
+        if isinstance(event, AckEvent):
+            return
+        with self._cond:
+            if not self._awaiting:
+                return
+            _, then = self._awaiting.popleft()
+        then(event.location if isinstance(event, LocationEvent) else event.text)
+
+    def _expire_replies(self):
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            while self._awaiting and self._awaiting[0][0] <= now:
+                expired.append(self._awaiting.popleft()[1])
+        for then in expired:
+            then(None)
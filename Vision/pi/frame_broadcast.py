@@ -0,0 +1,346 @@
+"""One producer, many MJPEG viewers: fan-out of the latest frame in per-client quality tiers.
+
+Each multipart part goes out as three buffers: a header built once per tier
+per frame, the encoded JPEG shared by every viewer on that tier, and the
+trailer. Nothing concatenates them per viewer; on a socket we own they are
+written with one vectored sendmsg() (send_vectored).
+"""
+
+import socket
+import struct
+import threading
+import time
+from typing import NamedTuple
+
+import cv2
+
+try:
+    import fcntl
+    import termios
+    _SIOCOUTQ = termios.TIOCOUTQ  # same ioctl number; on a socket it reports unsent bytes (Linux)
+except (ImportError, AttributeError):
+    _SIOCOUTQ = None
+
+from latency_trace import LatencyHistogram
+
+
+class StreamTier(NamedTuple):
+    name: str
+    scale: float  # of the published frame's width and height
+    quality: int  # cv2.IMWRITE_JPEG_QUALITY
+
+
+# Best first; viewers start at the top and step down while their writes block
+TIERS = (
+    StreamTier("high", 1.0, 85),
+    StreamTier("medium", 0.75, 70),
+    StreamTier("low", 0.5, 55),
+    StreamTier("minimal", 0.33, 40),
+)
+
+
+def unsent_bytes(sock):
+    """Bytes written to `sock` that the peer has not acknowledged yet, or None if unknown."""
+    if sock is None or _SIOCOUTQ is None:
+        return None
+    try:
+        return struct.unpack("i", fcntl.ioctl(sock.fileno(), _SIOCOUTQ, b"\0\0\0\0"))[0]
+    except OSError:
+        return None
+
+
+TRAILER = b'\r\n'
+
+
+def part_header(jpeg_size, timestamp, frame_id=None):
+    # X-Timestamp (capture time) lets bench_stream.py measure frame age; X-Frame lets
+    # viewer.html match the frame to its detection record. <img> viewers ignore both
+    frame = b'X-Frame: %d\r\n' % frame_id if frame_id is not None else b''
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: %d\r\n'
+            b'X-Timestamp: %.6f\r\n%s\r\n' % (jpeg_size, timestamp, frame))
+
+
+def send_vectored(sock, buffers):
+    """Write every buffer to a blocking socket like sendall(), without joining them first."""
+    views = [memoryview(buffer) for buffer in buffers if len(buffer)]
+    while views:
+        sent = sock.sendmsg(views)
+        # A short write: drop what went out and resume mid-buffer (slicing a memoryview copies nothing)
+        while sent:
+            if sent >= views[0].nbytes:
+                sent -= views[0].nbytes
+                views.pop(0)
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+
+class TierController:
+    """Chooses a viewer's tier from how long it was unable to take frames.
+
+    A write that blocks for most of a frame interval, or a frame skipped
+    because the previous ones are still in the socket's send queue, means
+    the viewer cannot take frames this size as fast as they are produced.
+    Blocking for `slow_writes` frame intervals in a row (over
+    one long write or several) steps down a tier; `fast_writes` writes in a
+    row that return almost at once step back up.
+    """
+
+    def __init__(self, tiers=len(TIERS), tier=0, slow_writes=2, fast_writes=45,
+                 slow_fraction=0.8, fast_fraction=0.25):
+        self.tiers = tiers
+        self.tier = tier
+        self.slow_writes = slow_writes
+        self.fast_writes = fast_writes
+        self.slow_fraction = slow_fraction
+        self.fast_fraction = fast_fraction
+        self._slow = 0
+        self._fast = 0
+        self.changes = 0
+
+    def update(self, write_seconds, interval_seconds):
+        """Account one write (or skipped frame); returns the tier for the next frame."""
+        if write_seconds >= self.slow_fraction * interval_seconds:
+            self._slow += max(1, int(write_seconds / interval_seconds))
+            self._fast = 0
+        elif write_seconds <= self.fast_fraction * interval_seconds:
+            self._fast += 1
+            self._slow = 0
+        else:
+            self._slow = self._fast = 0
+
+        if self._slow >= self.slow_writes and self.tier < self.tiers - 1:
+            self.tier += 1
+            self._slow = 0
+            self.changes += 1
+        elif self._fast >= self.fast_writes and self.tier > 0:
+            self.tier -= 1
+            self._fast = 0
+            self.changes += 1
+        return self.tier
+
+
+class Viewer:
+    """One viewer's place in the fan-out: its tier, the last frame it saw, and the broadcaster's counts.
+
+    parts() drives one per blocking viewer; an event-loop server that does
+    its own writing creates one per connection, calls pick() for each new
+    frame, written() once the part is out, and close() when the viewer goes.
+    """
+
+    def __init__(self, broadcaster, controller=None):
+        self.broadcaster = broadcaster
+        self.controller = controller or TierController(len(broadcaster.tiers))
+        self.tier = self.controller.tier
+        self.last_seq = 0
+        broadcaster._move(None, self.tier)
+        with broadcaster._cond:
+            broadcaster.subscribers += 1
+
+    def pick(self, latest, queued=None):
+        """(header, jpeg) to write from a wait() result, or None to skip the frame.
+
+        `queued`: bytes still waiting to go out to this viewer, if known.
+        """
+        broadcaster = self.broadcaster
+        seq, parts, _ = latest
+        if self.last_seq:
+            broadcaster.frames_skipped += seq - self.last_seq - 1
+        self.last_seq = seq
+        if not parts:
+            return None  # published before this viewer's tier was wanted
+        # The tier may have changed after this frame was encoded: take the nearest smaller one
+        index = min(parts, key=lambda i: (i < self.tier, abs(i - self.tier)))
+        header, jpeg = parts[index]
+        if queued is not None and queued > len(jpeg):
+            # Still sending earlier frames; wait for a newer one rather than queue this
+            broadcaster.frames_skipped += 1
+            self.written(broadcaster.frame_interval)
+            return None
+        return header, jpeg
+
+    def written(self, blocked):
+        """Account a part that took `blocked` seconds to write; may move the viewer to another tier."""
+        new_tier = self.controller.update(blocked, self.broadcaster.frame_interval)
+        if new_tier != self.tier:
+            self.broadcaster._move(self.tier, new_tier)
+            self.tier = new_tier
+
+    def close(self):
+        self.broadcaster._move(self.tier, None)
+        with self.broadcaster._cond:
+            self.broadcaster.subscribers -= 1
+
+
+def limit_send_buffer(sock, size):
+    """Cap a viewer socket's kernel send buffer so frames are skipped, not queued, when it falls behind."""
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, size)
+        except OSError:
+            pass  # keep the default buffer; tiers just react later
+
+
+class FrameBroadcaster:
+    """Keeps the most recent frame, JPEG-encoded once per tier that has viewers.
+
+    The vision pipeline calls publish_frame() with each annotated frame. It
+    is encoded for every tier at least one viewer is on (once, however many
+    viewers share the tier) and every waiting viewer is woken. A viewer is
+    always handed the newest frame, never a queue of old ones: frames
+    published while it was still writing, or while the socket still holds
+    more than a frame of unsent data, are simply skipped, and when that keeps
+    happening it moves to a smaller, lower-quality tier.
+
+    The best-quality JPEG of the newest encoded frame is also kept as a
+    snapshot, so still-image requests reuse what viewers already paid for;
+    request_frame() gets one encoded when nobody is streaming.
+    """
+
+    def __init__(self, tiers=TIERS, interval_alpha=0.1):
+        self.tiers = tuple(tiers)
+        self.interval_alpha = interval_alpha
+        self._cond = threading.Condition()
+        self._parts = {}  # tier index -> (part header, JPEG bytes) of the newest frame
+        self._timestamp = None
+        self._published_at = None
+        self._seq = 0
+        self.subscribers = 0
+        self.tier_clients = [0] * len(self.tiers)
+        self.frame_interval = 1 / 15  # smoothed seconds between published frames
+        self._snapshot = None  # (JPEG bytes, timestamp, monotonic publish time) of the best tier last encoded
+        self._snapshot_requested = False
+        self._listeners = []  # called with the seq of every published frame
+
+        self.encode_ms = LatencyHistogram()
+        self.frames_encoded = [0] * len(self.tiers)
+        self.bytes_encoded = [0] * len(self.tiers)
+        self.frames_skipped = 0  # frames a viewer never got because it was still writing
+
+    def publish_frame(self, frame, timestamp=None, frame_id=None):
+        """Encode `frame` for the tiers viewers are on and publish it.
+
+        `timestamp`: wall-clock capture time of the frame (time.time() by default).
+        `frame_id`: sent with each part so viewers can line up per-frame metadata.
+        """
+        with self._cond:
+            wanted = [index for index, clients in enumerate(self.tier_clients) if clients]
+            if self._snapshot_requested and 0 not in wanted:
+                wanted.insert(0, 0)
+            self._snapshot_requested = False
+        timestamp = time.time() if timestamp is None else timestamp
+        parts = {}
+        height, width = frame.shape[:2]
+        for index in wanted:
+            tier = self.tiers[index]
+            start = time.perf_counter()
+            image = frame if tier.scale == 1.0 else cv2.resize(
+                frame, (int(width * tier.scale), int(height * tier.scale)), interpolation=cv2.INTER_AREA)
+            _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, tier.quality])
+            self.encode_ms.add((time.perf_counter() - start) * 1000)
+            # The one copy of the JPEG: WSGI servers only take bytes, and every viewer shares this one
+            jpeg = buffer.tobytes()
+            parts[index] = (part_header(len(jpeg), timestamp, frame_id), jpeg)
+            self.frames_encoded[index] += 1
+            self.bytes_encoded[index] += len(jpeg)
+
+        now = time.monotonic()
+        with self._cond:
+            if self._published_at is not None:
+                self.frame_interval += self.interval_alpha * (now - self._published_at - self.frame_interval)
+            self._published_at = now
+            self._parts = parts
+            self._timestamp = timestamp
+            if parts:
+                self._snapshot = (parts[min(parts)][1], timestamp, now)
+            self._seq += 1
+            seq = self._seq
+            self._cond.notify_all()
+        for listener in list(self._listeners):
+            listener(seq)
+
+    @property
+    def wanted(self):
+        """Whether the next published frame will be encoded at all (a viewer or a snapshot wants it)."""
+        return self.subscribers > 0 or self._snapshot_requested
+
+    def request_frame(self):
+        """Have the next publish_frame() encode the best tier even if nobody is streaming."""
+        with self._cond:
+            self._snapshot_requested = True
+
+    def snapshot(self, max_age=None):
+        """(JPEG bytes, timestamp) of the newest encoded frame, or None if none is younger than `max_age` s."""
+        with self._cond:
+            snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        jpeg, timestamp, published = snapshot
+        if max_age is not None and time.monotonic() - published > max_age:
+            return None
+        return jpeg, timestamp
+
+    def add_listener(self, callback):
+        """Call `callback(seq)` on the publishing thread after every frame; it must not block."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self._listeners.remove(callback)
+
+    def wait(self, last_seq=0, timeout=None):
+        """The first frame newer than `last_seq` as (seq, {tier: (header, jpeg)}, timestamp).
+
+        Returns None on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > last_seq, timeout):
+                return None
+            return self._seq, self._parts, self._timestamp
+
+    def _move(self, old, new):
+        with self._cond:
+            if old is not None:
+                self.tier_clients[old] -= 1
+            if new is not None:
+                self.tier_clients[new] += 1
+
+    def stream(self, timeout=5.0, controller=None, sock=None, send_buffer=64 * 1024):
+        """WSGI body for one viewer: the header, JPEG and trailer of each part as separate bytes."""
+        for part in self.parts(timeout, controller, sock, send_buffer):
+            yield from part
+
+    def serve(self, sock, timeout=5.0, controller=None, send_buffer=64 * 1024):
+        """Stream to a connected socket (after the HTTP response headers) until the viewer goes away."""
+        try:
+            for part in self.parts(timeout, controller, sock, send_buffer):
+                send_vectored(sock, part)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def parts(self, timeout=5.0, controller=None, sock=None, send_buffer=64 * 1024):
+        """Generator of (header, jpeg, trailer) for each multipart part one viewer gets.
+
+        Each resume of the generator means the caller finished writing the
+        previous part, so the time in between is how long the write blocked.
+        Pass the viewer's socket to cap its send buffer at `send_buffer`
+        bytes and to hold frames back while its send queue is still
+        draining: otherwise the kernel queues megabytes of stale frames
+        before a write ever blocks.
+        """
+        limit_send_buffer(sock, send_buffer)
+        viewer = Viewer(self, controller)
+        try:
+            while True:
+                latest = self.wait(viewer.last_seq, timeout)
+                if latest is None:
+                    continue
+                part = viewer.pick(latest, unsent_bytes(sock))
+                if part is None:
+                    continue
+                written = time.monotonic()
+                yield part + (TRAILER,)
+                viewer.written(time.monotonic() - written)
+        finally:
+            viewer.close()
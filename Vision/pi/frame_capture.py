@@ -0,0 +1,252 @@
+"""Threaded Picamera2 capture into pooled, preallocated frames."""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+try:
+    from picamera2 import MappedArray
+except ImportError:  # off the Pi, with synthetic_camera.SyntheticCamera
+    MappedArray = None
+
+from frame_pool import FramePool
+
+
+def configure_camera(picam2, main_size, lores_size=None, lores_format="YUV420"):
+    """Configure Picamera2 with a display stream and, optionally, an inference stream.
+
+    With `lores_size` the camera also produces a small "lores" stream for the
+    detectors, while the higher-resolution "main" stream is kept for the
+    dashboard. YUV420 is the only lores format the Pi 4 ISP supports; on a
+    Pi 5 pass lores_format="BGR888", which libcamera lays out in RGB byte
+    order, so MediaPipe can take the buffer without any conversion. Keep the
+    lores width a multiple of 64 so the buffer carries no stride padding.
+    """
+    lores = {"size": lores_size, "format": lores_format} if lores_size else None
+    picam2.configure(picam2.create_video_configuration(main={"size": main_size, "format": "RGB888"}, lores=lores))
+
+
+def _frame_shape(stream_config):
+    width, height = stream_config["size"]
+    if stream_config["format"] == "YUV420":
+        return (height * 3 // 2, width)
+    if stream_config["format"] in ("XRGB8888", "XBGR8888"):
+        return (height, width, 4)
+    return (height, width, 3)
+
+
+def _mapped(request, stream):
+    # SyntheticCamera requests map themselves; Picamera2's go through MappedArray
+    if hasattr(request, "mapped_array"):
+        return request.mapped_array(stream)
+    return MappedArray(request, stream)
+
+
+def _sensor_time_ns(metadata):
+    # libcamera stamps the start of exposure on CLOCK_BOOTTIME; shift it onto time.monotonic_ns()
+    sensor_ns = metadata.get("SensorTimestamp")
+    if not sensor_ns:
+        return None
+    return sensor_ns - (time.clock_gettime_ns(time.CLOCK_BOOTTIME) - time.monotonic_ns())
+
+
+class CapturedFrame:
+    """Frame buffers handed out by FrameCapture.latest().
+
+    Holds one reference on the pooled main (and lores) buffer, so the capture
+    thread cannot recycle them until release() is called and the consumer can
+    draw on `frame` in place. Call retain() to hand the frame to another
+    holder, which must release() it too.
+    """
+
+    def __init__(self, buffers, seq, timestamp, sensor_ns=None):
+        self._buffers = buffers  # stream -> PooledFrame
+        self.seq = seq
+        self.timestamp = timestamp  # time.monotonic() when the frame was captured
+        self.sensor_ns = sensor_ns  # start of exposure on the time.monotonic_ns() clock, if known
+        self.frame = buffers["main"].array
+        # Inference frame when the camera has a lores stream, else None
+        self.lores = buffers["lores"].array if "lores" in buffers else None
+        self._released = False
+
+    def buffer(self, stream):
+        return self._buffers[stream]
+
+    def retain(self):
+        for buffer in self._buffers.values():
+            buffer.retain()
+        return CapturedFrame(self._buffers, self.seq, self.timestamp, self.sensor_ns)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            for buffer in self._buffers.values():
+                buffer.release()
+
+
+class RGBConverter:
+    """Produces the RGB (SRGB) frame MediaPipe expects from a CapturedFrame.
+
+    convert() returns a PooledFrame that the caller releases. A lores stream
+    captured in RGB byte order is shared as is (one more reference on the
+    captured buffer); otherwise the conversion writes into a buffer drawn from
+    the converter's pool instead of allocating a fresh full-size array.
+    """
+
+    def __init__(self, capture, pool_size=2):
+        config = capture.picam2.camera_configuration()
+        self.stream = "lores" if "lores" in capture.streams else "main"
+        stream_config = config[self.stream]
+        width, height = stream_config["size"]
+
+        if stream_config["format"] == "BGR888":
+            self.code = None  # already RGB byte order
+        elif stream_config["format"] == "YUV420":
+            self.code = cv2.COLOR_YUV2RGB_I420  # libcamera YUV420 is I420 (Y, U, V planes), not YV12
+        elif stream_config["format"] == "XRGB8888":
+            self.code = cv2.COLOR_BGRA2RGB
+        else:
+            self.code = cv2.COLOR_BGR2RGB
+        self.pool = None if self.code is None else FramePool((height, width, 3), size=pool_size)
+
+    def convert(self, captured):
+        src = captured.buffer(self.stream)
+        if self.code is None:
+            return src.retain()
+        rgb = self.pool.acquire()
+        if rgb is None:
+            raise RuntimeError("RGB frame pool exhausted; are converted frames being released?")
+        cv2.cvtColor(src.array, self.code, dst=rgb.array)
+        return rgb
+
+
+class FrameCapture:
+    """Captures camera frames on a dedicated thread ("latest frame wins").
+
+    Frames (main, plus lores when configured, from the same request) are
+    copied straight out of the camera's DMA buffer into buffers drawn from a
+    FramePool per stream. The capture thread keeps one reference on the newest
+    frame and drops it when a newer one arrives, so a slow consumer never
+    builds a queue: frames it did not get to go straight back to the pool and
+    are counted in `frames_dropped`. The pools grow (and count the allocation)
+    only when readers hold on to more frames than the preallocated buffers.
+    """
+
+    def __init__(self, picam2, num_buffers=3, max_buffers=8):
+        if num_buffers < 3:
+            raise ValueError("num_buffers must be at least 3 (write, latest, read)")
+        self.picam2 = picam2
+
+        config = picam2.camera_configuration()
+        self.streams = ("main", "lores") if config.get("lores") else ("main",)
+        self.pools = {
+            stream: FramePool(_frame_shape(config[stream]), size=num_buffers, max_size=max_buffers)
+            for stream in self.streams
+        }
+        self._latest = None  # stream -> PooledFrame of the newest frame
+        self._latest_seq = 0
+        self._latest_time = 0.0
+        self._latest_sensor_ns = None
+
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self._last_read_seq = 0
+
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="FrameCapture", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def latest(self, previous=None, timeout=None):
+        """Return the newest frame captured after `previous`.
+
+        `previous` (the CapturedFrame from the last call) is released first.
+        Blocks until a newer frame exists; returns None on timeout or stop.
+        """
+        last_seq = 0
+        if previous is not None:
+            last_seq = previous.seq
+            previous.release()
+
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._latest_seq > last_seq or not self._running, timeout):
+                return None
+            if self._latest_seq <= last_seq:
+                return None
+            for buffer in self._latest.values():
+                buffer.retain()
+            seq = self._latest_seq
+
+            if self._last_read_seq:
+                self.frames_dropped += seq - self._last_read_seq - 1
+            self._last_read_seq = seq
+            return CapturedFrame(dict(self._latest), seq, self._latest_time, self._latest_sensor_ns)
+
+    def _acquire(self):
+        buffers = {}
+        for stream in self.streams:
+            buffer = self.pools[stream].acquire()
+            if buffer is None:
+                for acquired in buffers.values():
+                    acquired.release()
+                return None
+            buffers[stream] = buffer
+        return buffers
+
+    def _run(self):
+        while self._running:
+            buffers = self._acquire()
+            if buffers is None:
+                # Every buffer is held by readers; wait a moment instead of overwriting one
+                time.sleep(0.001)
+                continue
+
+            try:
+                request = self.picam2.capture_request()
+                try:
+                    sensor_ns = _sensor_time_ns(request.get_metadata())
+                    for stream in self.streams:
+                        with _mapped(request, stream) as mapped:
+                            dst = buffers[stream].array
+                            # Crop away any row padding (stride) the ISP added
+                            np.copyto(dst, mapped.array[tuple(slice(0, n) for n in dst.shape)])
+                finally:
+                    request.release()
+            except Exception:
+                # Hand the buffers back and mark capture stopped, so latest() returns None
+                # instead of waiting forever on a dead thread
+                for buffer in buffers.values():
+                    buffer.release()
+                with self._cond:
+                    self._running = False
+                    self._cond.notify_all()
+                raise
+
+            with self._cond:
+                previous = self._latest
+                self._latest = buffers
+                self._latest_seq += 1
+                self._latest_time = time.monotonic()
+                self._latest_sensor_ns = sensor_ns
+                self.frames_captured += 1
+                self._cond.notify_all()
+            # The capture thread's own reference on the superseded frame
+            if previous is not None:
+                for buffer in previous.values():
+                    buffer.release()
@@ -0,0 +1,107 @@
+"""Reference-counted pool of preallocated frame buffers."""
+
+import resource
+import threading
+
+import numpy as np
+
+
+class PooledFrame:
+    """A pool buffer with a reference count.
+
+    Whoever acquires a frame owns one reference. Anything that keeps the
+    frame beyond that (an async model call, a streaming client) calls
+    retain() and later release(); the buffer goes back to the pool only when
+    the last reference is released, so it is never recycled under a holder.
+    """
+
+    def __init__(self, pool, array):
+        self._pool = pool
+        self.array = array
+        self._refs = 0
+
+    def retain(self):
+        with self._pool._lock:
+            if self._refs <= 0:
+                raise RuntimeError("retain() on a frame that is back in the pool")
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._pool._lock:
+            if self._refs <= 0:
+                raise RuntimeError("release() on a frame that is back in the pool")
+            self._refs -= 1
+            if self._refs == 0:
+                self._pool._free.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class FramePool:
+    """Fixed-shape frame buffers recycled between capture, conversion and overlay.
+
+    `size` buffers are allocated up front. acquire() hands out a free one, or
+    allocates a new one while the pool is below `max_size`. Every allocation
+    after start-up is counted, so a steady-state loop should show
+    `allocations` staying at `size`.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, size=3, max_size=8):
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.max_size = max(size, max_size)
+        self._lock = threading.Lock()
+        self._all = [PooledFrame(self, np.empty(self.shape, dtype=dtype)) for _ in range(size)]
+        self._free = list(self._all)
+
+        self.allocations = size
+        self.acquires = 0
+        self.peak_in_use = 0
+
+    def acquire(self):
+        """Return a frame holding one reference, or None if the pool is exhausted."""
+        with self._lock:
+            if self._free:
+                frame = self._free.pop()
+            elif len(self._all) < self.max_size:
+                frame = PooledFrame(self, np.empty(self.shape, dtype=self.dtype))
+                self._all.append(frame)
+                self.allocations += 1
+            else:
+                return None
+            frame._refs = 1
+            self.acquires += 1
+            self.peak_in_use = max(self.peak_in_use, len(self._all) - len(self._free))
+            return frame
+
+    @property
+    def in_use(self):
+        with self._lock:
+            return len(self._all) - len(self._free)
+
+    def stats(self):
+        return {
+            "shape": self.shape,
+            "buffers": len(self._all),
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "acquires": self.acquires,
+            "allocations": self.allocations,
+        }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def allocation_report(frames, pools):
+    """One line on buffer allocations per frame and peak RSS; both should stay flat over long runs."""
+    allocations = sum(pool.allocations for pool in pools)
+    return (f"Frames: {frames}, buffer allocations: {allocations} "
+            f"({allocations / max(frames, 1):.4f}/frame), peak RSS: {peak_rss_mb():.1f} MB")
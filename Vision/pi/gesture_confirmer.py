@@ -0,0 +1,74 @@
+"""Confirms a gesture by voting over a sliding window of recognizer results."""
+
+from collections import deque
+
+
+class GestureConfirmer:
+    """Streaming vote over the last `window` seconds of GestureRecognizer results.
+
+    Feed every result, including frames with no hands, as update(t, hands)
+    with hands = [(category, score, handedness), ...] (session_trace.
+    hand_gestures() builds that from a result). Each frame gives a category
+    the best score * hand weight among the hands showing it; a category is
+    confirmed once its votes reach `threshold` of the frames in the window
+    over at least `min_frames` frames. It is reported once, and can only be
+    confirmed again after its share has dropped below `release`.
+
+    Each update costs O(hands + expired frames), whatever the window length.
+    """
+
+    def __init__(self, window=1.0, threshold=0.6, release=0.3, min_frames=3, min_score=0.5,
+                 hand_weights=None, ignore=("None",)):
+        self.window = window
+        self.threshold = threshold
+        self.release = release
+        self.min_frames = min_frames
+        self.min_score = min_score
+        self.hand_weights = hand_weights or {}  # e.g. {"Right": 1.0, "Left": 0.8}; missing = 1.0
+        self.ignore = set(ignore)
+
+        self._frames = deque()  # (t, {category: vote})
+        self._totals = {}  # category -> sum of votes in the window
+        self._held = set()  # confirmed and not yet released
+
+        self.results = 0
+        self.confirmations = 0
+
+    def update(self, t, hands):
+        """Add one recognizer result; returns the newly confirmed category or None."""
+        self.results += 1
+        votes = {}
+        for category, score, handedness in hands:
+            if category in self.ignore or score < self.min_score:
+                continue
+            vote = score * self.hand_weights.get(handedness, 1.0)
+            if vote > votes.get(category, 0.0):
+                votes[category] = vote
+
+        self._frames.append((t, votes))
+        for category, vote in votes.items():
+            self._totals[category] = self._totals.get(category, 0.0) + vote
+        while self._frames and self._frames[0][0] <= t - self.window:
+            _, expired = self._frames.popleft()
+            for category, vote in expired.items():
+                self._totals[category] -= vote
+                if self._totals[category] <= 1e-9:
+                    del self._totals[category]
+
+        frames = len(self._frames)
+        for category in list(self._held):
+            if self._totals.get(category, 0.0) < self.release * frames:
+                self._held.discard(category)
+
+        if frames < self.min_frames:
+            return None
+        best = max(self._totals, key=self._totals.get, default=None)
+        if best is None or best in self._held or self._totals[best] < self.threshold * frames:
+            return None
+        self._held.add(best)
+        self.confirmations += 1
+        return best
+
+    def share(self, category):
+        """Current vote share of a category in the window (0..1)."""
+        return self._totals.get(category, 0.0) / len(self._frames) if self._frames else 0.0
@@ -0,0 +1,100 @@
+"""Latency-driven frame admission for MediaPipe LIVE_STREAM models."""
+
+import threading
+import time
+from collections import deque
+
+
+class InferenceScheduler:
+    """Admits a new frame only once every model has answered the previous one.
+
+    detect_async/recognize_async return immediately, so submitting at the
+    camera rate just queues frames inside MediaPipe. Instead the vision loop
+    calls wait_ready() before submitting, and the result callbacks call
+    complete(). The effective inference rate then follows the slowest model's
+    measured latency, whatever the load on the Pi.
+    """
+
+    def __init__(self, models=("face", "gesture"), stall_timeout=1.0, fps_window=30, latency_alpha=0.2):
+        self.models = tuple(models)
+        self.stall_timeout = stall_timeout  # seconds before a missing callback is given up on
+        self.latency_alpha = latency_alpha
+
+        self._cond = threading.Condition()
+        self._pending = {}  # model -> (timestamp_ms, submit time)
+        self._last_timestamp_ms = 0
+        self._completions = deque(maxlen=fps_window)
+
+        self.latency_ms = {model: 0.0 for model in self.models}  # moving average per model
+        self.frames_submitted = 0
+        self.frames_completed = 0
+        self.stalls = 0
+
+    def next_timestamp_ms(self):
+        """A strictly increasing timestamp shared by every model for one frame."""
+        timestamp_ms = max(time.time_ns() // 1_000_000, self._last_timestamp_ms + 1)
+        self._last_timestamp_ms = timestamp_ms
+        return timestamp_ms
+
+    def ready(self):
+        with self._cond:
+            return self._drained()
+
+    def wait_ready(self, timeout=None):
+        """Block until the previous frame has drained from every model."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._drained():
+                # Wake up at least every stall_timeout so a lost callback is noticed
+                wait = self.stall_timeout
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return False
+                self._cond.wait(wait)
+            return True
+
+    def submit(self, timestamp_ms):
+        now = time.perf_counter()
+        with self._cond:
+            for model in self.models:
+                self._pending[model] = (timestamp_ms, now)
+            self.frames_submitted += 1
+
+    def complete(self, model, timestamp_ms):
+        """Record a result callback; call from each model's result_callback."""
+        now = time.perf_counter()
+        with self._cond:
+            pending = self._pending.get(model)
+            if pending is None or pending[0] != timestamp_ms:
+                return
+            del self._pending[model]
+
+            latency = (now - pending[1]) * 1000
+            average = self.latency_ms[model]
+            self.latency_ms[model] = latency if average == 0 else average + self.latency_alpha * (latency - average)
+
+            if not self._pending:
+                self.frames_completed += 1
+                self._completions.append(now)
+                self._cond.notify_all()
+
+    @property
+    def fps(self):
+        """Effective inference rate over the last `fps_window` frames."""
+        with self._cond:
+            if len(self._completions) < 2:
+                return 0.0
+            span = self._completions[-1] - self._completions[0]
+            return (len(self._completions) - 1) / span if span > 0 else 0.0
+
+    def _drained(self):
+        if not self._pending:
+            return True
+        # A callback that never arrives must not stall the loop forever
+        oldest = min(submitted for _, submitted in self._pending.values())
+        if time.perf_counter() - oldest > self.stall_timeout:
+            self._pending.clear()
+            self.stalls += 1
+            return True
+        return False
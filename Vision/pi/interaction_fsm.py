@@ -0,0 +1,379 @@
+"""Study/break/standby behaviour of the robot as an explicit state machine.
+
+The vision loop, the serial reader and the command dispatcher post typed
+events (people count, gesture, location, location reply) to an
+InteractionRunner; its thread hands each one to the InteractionFSM as soon as
+it arrives. The timed nudges are cancellable timers on a TimerWheel that fire
+Timeout events into the FSM at their deadline. The FSM
+only talks to the robot through the `send` and `request_location` callables it
+is given, so it can be imported and driven without the camera, the models or
+the serial port.
+
+States:
+    STANDBY       not studying; waves back, looks around when left alone
+    LOOKING       standby, looking left then right for people
+    STUDY         study session running, break nudge pending
+    BREAK_NUDGED  BREAK_<colour> sent, waiting for the robot to reach that spot
+    ON_BREAK      robot is at the break location
+    RETURNING     BACK_TO_STUDY sent, waiting for the robot to be back on the desk
+"""
+
+import queue
+import random
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from timer_wheel import TimerWheel
+
+STANDBY = "STANDBY"
+LOOKING = "LOOKING"
+STUDY = "STUDY"
+BREAK_NUDGED = "BREAK_NUDGED"
+ON_BREAK = "ON_BREAK"
+RETURNING = "RETURNING"
+
+STUDY_STATES = (STUDY, BREAK_NUDGED, ON_BREAK, RETURNING)
+STATES = (STANDBY, LOOKING) + STUDY_STATES
+BREAK_LOCATIONS = ("PURPLE", "YELLOW")
+LOCATIONS = ("BLUE",) + BREAK_LOCATIONS  # the desk and the break spots
+
+# Timings in seconds
+FIRST_BREAK_NUDGE = 40  # 1 min for the capstone showcase
+SECOND_BREAK_NUDGE = 70
+FIRST_STUDY_NUDGE = 20  # 80 TBC
+SECOND_STUDY_NUDGE = 30
+ALONE_TIMEOUT = 15
+LOOK_DURATION = 2  # how many seconds to spend "looking" each way
+WAVE_COOLDOWN = 3
+GESTURE_RECENT = 1  # a confirmed gesture this recent keeps the alone timer from starting
+LOCATION_RETRY = 1  # ask again after an unanswered CHECK_LOCATION
+
+# Timers that belong to a study session, cancelled when it ends
+STUDY_TIMERS = ("break_nudge", "second_break_nudge", "study_nudge", "second_study_nudge")
+
+
+class PeopleCount(NamedTuple):
+    count: int
+    timestamp: float  # time.monotonic()
+    frame_ms: Optional[int] = None  # inference timestamp of the frame it came from (latency tracing)
+
+
+class Gesture(NamedTuple):
+    name: str  # confirmed MediaPipe category (see GestureConfirmer), e.g. "Closed_Fist"
+    timestamp: float
+    frame_ms: Optional[int] = None
+
+
+class Location(NamedTuple):
+    location: str  # BLUE (desk), PURPLE or YELLOW
+    timestamp: float
+
+
+class LocationReply(NamedTuple):
+    purpose: str  # what the CHECK_LOCATION was for
+    location: Optional[str]  # None if the board did not answer
+    timestamp: float
+
+
+class Timeout(NamedTuple):
+    name: str  # which timer fired, e.g. "break_nudge"
+    timestamp: float  # the timer's deadline
+
+
+class InteractionFSM:
+    """Decides which command the robot gets for each event.
+
+    send(command, hold=0.0, repeat=False, frame_ms=None) queues a command;
+    repeat=True for commands that must go out even if they match the previous
+    one (WAVE); frame_ms is the frame of the detection that led to it.
+    request_location(purpose) asks the board where it is; its answer has to
+    come back as a LocationReply event. Timers are scheduled on `timers` and
+    fire on whichever thread advances it (the InteractionRunner's).
+    """
+
+    def __init__(self, send, request_location, timers=None, choose=random.choice):
+        self._send = send
+        self.request_location = request_location
+        self.timers = timers if timers is not None else TimerWheel()
+        self.choose = choose  # picks the break location
+        self._pending = {}  # timer name -> Timer
+
+        self.state = None
+        self.people = 0
+        self.location = "Nowhere"
+        self.break_location = None
+
+        self.check_for_people = False
+        self.look_side = None
+
+        self._last_gesture_time = None
+        self._frame_ms = None  # frame of the event being handled, for the commands it sends
+
+        self._handlers = {
+            PeopleCount: self._on_people,
+            Gesture: self._on_gesture,
+            Location: self._on_location,
+            LocationReply: self._on_location_reply,
+            Timeout: self._on_timeout,
+        }
+
+    @property
+    def studying(self):
+        return self.state in STUDY_STATES
+
+    def start(self, now):
+        self._enter(STANDBY, now)
+
+    def handle(self, event):
+        if self.state is None:
+            self.start(event.timestamp)
+        self._frame_ms = getattr(event, "frame_ms", None)
+        try:
+            self._handlers[type(event)](event)
+        finally:
+            self._frame_ms = None
+
+    def send(self, command, hold=0.0, repeat=False):
+        self._send(command, hold=hold, repeat=repeat, frame_ms=self._frame_ms)
+
+    # --- timers ---
+
+    def _start_timer(self, name, delay, now):
+        # (Re)schedule: a restart or extension simply replaces the pending timer
+        self._cancel_timer(name)
+        self._pending[name] = self.timers.schedule(
+            delay, lambda: self._fire(name, now + delay), now=now)
+
+    def _cancel_timer(self, name):
+        timer = self._pending.pop(name, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _fire(self, name, deadline):
+        self._pending.pop(name, None)
+        self.handle(Timeout(name, deadline))
+
+    def timer_pending(self, name):
+        return name in self._pending
+
+    def timers_remaining(self, now):
+        """Seconds left on each pending timer; safe to call from another thread."""
+        return {name: max(0.0, timer.deadline - now) for name, timer in list(self._pending.items())}
+
+    # --- transitions ---
+
+    def _enter(self, state, now):
+        previous, self.state = self.state, state
+        if state == STANDBY:
+            self.look_side = None
+            self._cancel_timer("look")
+            for name in STUDY_TIMERS:
+                self._cancel_timer(name)
+            if previous not in (STANDBY, LOOKING):
+                self.send(b'STANDBY')
+            if self.check_for_people:
+                self._start_looking(now)
+        elif state == STUDY:
+            self.break_location = None
+            for name in STUDY_TIMERS:
+                self._cancel_timer(name)
+            self._start_timer("break_nudge", FIRST_BREAK_NUDGE, now)
+            self._start_timer("second_break_nudge", SECOND_BREAK_NUDGE, now)
+        elif state == ON_BREAK:
+            self._cancel_timer("break_nudge")
+            self._cancel_timer("second_break_nudge")
+            self._start_timer("study_nudge", FIRST_STUDY_NUDGE, now)
+            self._start_timer("second_study_nudge", SECOND_STUDY_NUDGE, now)
+        self._check_location(now)
+
+    def _check_location(self, now):
+        # Location-dependent transitions, run on every location change and state entry
+        if self.state == BREAK_NUDGED and self.location == self.break_location:
+            self._enter(ON_BREAK, now)
+        elif self.state == RETURNING and self.location == "BLUE":
+            # Taken back to desk - all good
+            self.send(b'STUDY_RESTART')
+            self._enter(STUDY, now)
+
+    # --- event handlers ---
+
+    def _on_people(self, event):
+        count = event.count
+        if count != self.people:
+            # 1) Takes precedence - people are detected
+            if self.people == 0 and count > 0 and not self.studying:
+                # Later commands wait for the animation
+                self.send(b'DETECTED', hold=1.5)
+            # 2) Be shy (also during study mode)
+            elif count >= 3:
+                self.send(b'SHY')
+            # 3) If expected people, normal position
+            elif count > 0:
+                self.send(b'NEUTRAL')
+            self.people = count
+        if count > 0:
+            self._cancel_timer("alone")
+            self.check_for_people = False
+        elif not self.timer_pending("alone") and not self._recent_gesture(event.timestamp):
+            # Nobody here (and no hand waving without a face): start the alone timer
+            self._start_timer("alone", ALONE_TIMEOUT, event.timestamp)
+
+    def _on_gesture(self, event):
+        now = event.timestamp
+        self._last_gesture_time = now
+        if event.name == "Closed_Fist":
+            self._closed_fist(now)
+        elif event.name == "Thumb_Up" and self.studying:
+            # Quit Study Mode
+            print('Study Mode DEACTIVATED')
+            self._enter(STANDBY, now)
+        elif event.name == "Open_Palm" and not self.studying and not self.timer_pending("wave_cooldown"):
+            self._start_timer("wave_cooldown", WAVE_COOLDOWN, now)
+            self.send(b'WAVE', repeat=True)
+
+    def _recent_gesture(self, now):
+        return self._last_gesture_time is not None and now - self._last_gesture_time < GESTURE_RECENT
+
+    def _closed_fist(self, now):
+        if self.studying:
+            if self.location == "BLUE":
+                self.send(b'EXTEND_STUDY')
+                self._enter(STUDY, now)
+            # Study mode already active, this means they are on a break
+            elif self.location in BREAK_LOCATIONS:
+                self.send(b'EXTEND_BREAK')
+                self._enter(ON_BREAK, now)
+        elif self.location == "BLUE":
+            self.send(b'STUDY')
+            self._enter(STUDY, now)
+        else:
+            self.send(b'MOVE_TO_DESK')
+
+    def _on_location(self, event):
+        self.location = event.location
+        print(f"Detected: {self.location}")
+        self._check_location(event.timestamp)
+
+    def _on_location_reply(self, event):
+        if event.location not in LOCATIONS:
+            # No answer, or a NACK/noise line taken for one; ask again shortly
+            if event.purpose == "second_break_nudge" and self.state == BREAK_NUDGED:
+                self._start_timer("second_break_nudge", LOCATION_RETRY, event.timestamp)
+            elif event.purpose == "second_study_nudge" and self.state in (ON_BREAK, RETURNING):
+                self._start_timer("second_study_nudge", LOCATION_RETRY, event.timestamp)
+            return
+        if not self.studying:
+            return
+        self.location = event.location
+        if event.purpose == "second_break_nudge" and self.state == BREAK_NUDGED:
+            # Still on the desk after the first nudge: Nudge 2 - Sound
+            if self.location == "BLUE":
+                self.send(b'SECOND_BREAK_NUDGE')
+        elif event.purpose == "second_study_nudge" and self.state in (ON_BREAK, RETURNING):
+            # Still at the break spot: Nudge 2 - Sound
+            if self.location == self.break_location:
+                self.send(b'SECOND_STUDY_NUDGE')
+        self._check_location(event.timestamp)
+
+    def _on_timeout(self, event):
+        now = event.timestamp
+        name = event.name
+        if name == "break_nudge" and self.state == STUDY:
+            self.break_location = self.choose(BREAK_LOCATIONS)
+            # Nudge 1
+            self.send(f'BREAK_{self.break_location}'.encode())
+            self._enter(BREAK_NUDGED, now)
+        elif name == "second_break_nudge" and self.state == BREAK_NUDGED:
+            self.request_location("second_break_nudge")  # Reply arrives as a LocationReply
+        elif name == "study_nudge" and self.state == ON_BREAK:
+            if self.location != "BLUE":
+                self.send(b'BACK_TO_STUDY')  # Denote to be taken back
+            self._enter(RETURNING, now)
+        elif name == "second_study_nudge" and self.state in (ON_BREAK, RETURNING):
+            self.request_location("second_study_nudge")
+        elif name == "alone":
+            self.check_for_people = True
+            if self.state == STANDBY:
+                self._start_looking(now)
+            if self.people == 0 and not self._recent_gesture(now):
+                # Still alone: keep counting towards the next look
+                self._start_timer("alone", ALONE_TIMEOUT, now)
+        elif name == "look" and self.state == LOOKING:
+            if self.people > 0:
+                self._enter(STANDBY, now)
+            elif self.look_side == "left":
+                # No people found, look right
+                self.send(b'LOOK_RIGHT')
+                self.look_side = "right"
+                self._start_timer("look", LOOK_DURATION, now)
+            else:
+                self.send(b'NEUTRAL')
+                self._start_timer("alone", ALONE_TIMEOUT, now)
+                self._enter(STANDBY, now)
+
+    def _start_looking(self, now):
+        # Start by looking left
+        self.send(b'LOOK_LEFT')
+        self.state = LOOKING
+        self.look_side = "left"
+        self.check_for_people = False
+        self._start_timer("look", LOOK_DURATION, now)
+
+
+class InteractionRunner:
+    """Feeds posted events to an InteractionFSM on its own thread.
+
+    post() is safe from any thread (vision loop, MediaPipe callbacks, serial
+    reader). Between events the thread sleeps until the FSM's next timer is
+    due and advances the wheel, so timers fire at their deadline and nothing
+    polls while no timer is pending.
+    """
+
+    def __init__(self, fsm, clock=time.monotonic):
+        self.fsm = fsm
+        self.clock = clock
+        self._events = queue.SimpleQueue()
+        self._running = False
+        self._thread = None
+        self.events_handled = 0
+        self.timer_lateness_ms = 0.0  # worst delay between a timer's deadline and its firing
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="InteractionFSM", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._events.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def post(self, event):
+        self._events.put(event)
+
+    @property
+    def pending(self):
+        """Events posted and not yet handled."""
+        return self._events.qsize()
+
+    def _run(self):
+        timers = self.fsm.timers
+        self.fsm.start(self.clock())
+        while self._running:
+            deadline = timers.next_deadline()
+            timeout = None if deadline is None else max(0.0, deadline - self.clock())
+            try:
+                event = self._events.get(timeout=timeout)
+            except queue.Empty:
+                event = None
+            if event is not None:
+                self.fsm.handle(event)
+                self.events_handled += 1
+            now = self.clock()
+            if timers.advance(now) and deadline is not None and deadline <= now:
+                self.timer_lateness_ms = max(self.timer_lateness_ms, (now - deadline) * 1000)
@@ -0,0 +1,109 @@
+"""Per-frame latency tracing from sensor exposure to the Arduino's ACK.
+
+Each inference frame is a trace keyed by its timestamp_ms. The pipeline,
+the model callbacks, the fusion stage, the interaction FSM and the command
+dispatcher mark named points on it in time.monotonic_ns() (the sensor point
+is Picamera2's SensorTimestamp, shifted onto that clock). Every
+mark adds the stages that end at that point to their histograms, so nothing
+has to be finalized and frames that never lead to a command cost the same
+as those that do. A mark is a dict write and a few appends under one lock.
+
+Points, in order:
+    sensor, captured, dequeued, submitted, face, gesture, fused, decided, written, acked
+"""
+
+import bisect
+import threading
+import time
+from collections import OrderedDict, deque
+
+# stage -> (start point, end point); "inference" ends at whichever model answered last
+STAGES = {
+    "capture": ("sensor", "captured"),  # exposure to frame copied out of the camera buffer
+    "wait": ("captured", "dequeued"),  # waiting for the pipeline (latest-frame-wins)
+    "convert": ("dequeued", "submitted"),  # RGB conversion and mp.Image
+    "face": ("submitted", "face"),
+    "gesture": ("submitted", "gesture"),
+    "fusion": ("inference", "fused"),
+    "fsm": ("fused", "decided"),  # interaction queue and decision
+    "dispatch": ("decided", "written"),  # command queue, holds, serial write
+    "ack": ("written", "acked"),
+    "to_observation": ("sensor", "fused"),
+    "to_command": ("sensor", "decided"),
+    "to_ack": ("sensor", "acked"),
+}
+
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def percentile(values, q):
+    """Nearest-rank `q` quantile (0..1) of already sorted, non-empty `values`."""
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class LatencyHistogram:
+    """Cumulative buckets for scraping plus a recent window for percentiles."""
+
+    def __init__(self, window=1024):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum_ms = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        self.recent.append(ms)
+
+    def percentiles(self):
+        values = sorted(self.recent)
+        if not values:
+            return {}
+        pick = lambda q: round(percentile(values, q), 2)
+        return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "n": self.count}
+
+
+class LatencyTracer:
+    """Collects per-stage latency histograms from marks on per-frame traces."""
+
+    def __init__(self, max_traces=256, window=1024):
+        self.max_traces = max_traces
+        self._lock = threading.Lock()
+        self._traces = OrderedDict()  # trace_id -> {point: ns}
+        self.histograms = {stage: LatencyHistogram(window) for stage in STAGES}
+        self._ends = {}
+        for stage, (_, end) in STAGES.items():
+            self._ends.setdefault(end, []).append(stage)
+
+    def begin(self, trace_id, **points):
+        """Start a trace with already-known points, e.g. begin(ts, sensor=..., captured=...)."""
+        with self._lock:
+            self._traces[trace_id] = {}
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        for point, ns in points.items():
+            if ns is not None:
+                self.mark(trace_id, point, ns)
+
+    def mark(self, trace_id, point, ns=None):
+        """Record `point` on a trace (now by default); ignored for unknown or evicted traces."""
+        if trace_id is None:
+            return
+        ns = time.monotonic_ns() if ns is None else ns
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None or point in trace:
+                return
+            trace[point] = ns
+            if point in ("face", "gesture") and "face" in trace and "gesture" in trace:
+                trace["inference"] = max(trace["face"], trace["gesture"])
+            for stage in self._ends.get(point, ()):
+                start = trace.get(STAGES[stage][0])
+                if start is not None:
+                    self.histograms[stage].add((ns - start) / 1e6)
+
+    def summary(self):
+        with self._lock:
+            return {stage: histogram.percentiles() for stage, histogram in self.histograms.items()
+                    if histogram.count}
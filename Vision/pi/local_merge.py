@@ -72,6 +72,8 @@ def generate_frames(face_model: str, gesture_model: str, skip_frames: int = 3):
     last_gesture = None
     gesture_timer = time.time()  # Timer to manage gesture debounce duration
 
+    rgb_frame = None  # Reused RGB buffer, so the conversion does not allocate every frame
+
     while True:
         # Capture frame using Picamera2
         frame = picam2.capture_array()
@@ -81,7 +83,7 @@ def generate_frames(face_model: str, gesture_model: str, skip_frames: int = 3):
         if FRAME_COUNTER % skip_frames != 0:
             continue
 
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_frame)
         mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
 
         # Run Face Detection
@@ -0,0 +1,123 @@
+"""Prometheus text exposition of the pipeline's counters, built when /metrics is scraped.
+
+Nothing here runs on the hot paths: the pipeline keeps bumping the plain
+counters and histograms it already has (FrameCapture, InferenceScheduler,
+ResultChannel, LatencyTracer, SerialLink, ...) and a scrape reads them
+without taking their locks. A scrape can therefore see a counter one
+increment ahead of another, which Prometheus tolerates; it never stalls a
+callback thread.
+"""
+
+import threading
+import time
+from collections import deque
+
+from latency_trace import BUCKETS_MS, percentile
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class MetricsPage:
+    """Builds one exposition page; samples of a metric must be added back to back."""
+
+    def __init__(self, prefix="nomo_"):
+        self.prefix = prefix
+        self._lines = []
+        self._declared = set()
+
+    def _declare(self, name, kind, help):
+        if name not in self._declared:
+            self._declared.add(name)
+            self._lines.append(f"# HELP {name} {help}")
+            self._lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, value, labels=None):
+        self._lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def counter(self, name, help, value, labels=None):
+        name = self.prefix + name
+        if not name.endswith("_total"):
+            name += "_total"
+        self._declare(name, "counter", help)
+        self.sample(name, value, labels)
+
+    def gauge(self, name, help, value, labels=None):
+        name = self.prefix + name
+        self._declare(name, "gauge", help)
+        self.sample(name, value, labels)
+
+    def histogram(self, name, help, histogram, labels=None):
+        """A LatencyHistogram (milliseconds) as a Prometheus histogram in seconds."""
+        name = self.prefix + name
+        self._declare(name, "histogram", help)
+        labels = dict(labels or {})
+        counts = list(histogram.counts)  # copy: the owner keeps adding while we read
+        cumulative = 0
+        for bound_ms, count in zip(BUCKETS_MS + (float("inf"),), counts):
+            cumulative += count
+            self.sample(name + "_bucket", cumulative, {**labels, "le": _format_value(
+                bound_ms if bound_ms == float("inf") else bound_ms / 1000)})
+        self.sample(name + "_sum", histogram.sum_ms / 1000, labels)
+        self.sample(name + "_count", cumulative, labels)
+
+    def summary(self, name, help, values_ms, count, sum_ms, labels=None, quantiles=(0.5, 0.9, 0.99)):
+        """Quantiles of recent millisecond samples plus running count and sum, in seconds."""
+        name = self.prefix + name
+        self._declare(name, "summary", help)
+        labels = dict(labels or {})
+        values = sorted(values_ms)
+        for q in quantiles:
+            value = percentile(values, q) / 1000 if values else None
+            self.sample(name, value, {**labels, "quantile": _format_value(q)})
+        self.sample(name + "_sum", sum_ms / 1000, labels)
+        self.sample(name + "_count", count, labels)
+
+    def render(self):
+        return "\n".join(self._lines) + "\n"
+
+
+class RateMeter:
+    """Per-second rates of monotonically increasing counters, measured between scrapes.
+
+    Each rate(key, value) call stores a (time, value) point and returns the
+    rate over the points of the last `window` seconds, so any number of
+    scrapers share the same estimate. Returns None until two points exist.
+    """
+
+    def __init__(self, window=10.0, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._lock = threading.Lock()  # concurrent scrapes; never taken by the pipeline
+        self._points = {}  # key -> deque of (t, value)
+
+    def rate(self, key, value, now=None):
+        now = self.clock() if now is None else now
+        with self._lock:
+            points = self._points.setdefault(key, deque())
+            points.append((now, value))
+            # Keep one point at or before the window start so the span covers the whole window
+            while len(points) > 2 and points[1][0] <= now - self.window:
+                points.popleft()
+            start_t, start_value = points[0]
+        if now - start_t <= 0:
+            return None
+        return max(0.0, (value - start_value) / (now - start_t))
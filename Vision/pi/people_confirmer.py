@@ -0,0 +1,48 @@
+"""Smooths the per-frame face count before the interaction FSM acts on it."""
+
+from collections import Counter, deque
+
+
+class PeopleCountConfirmer:
+    """Majority vote over the last `window` seconds of face counts.
+
+    Feed every face detector result as update(t, count). A new count is
+    accepted once it makes up at least `threshold` of the frames in the
+    window, over at least `min_frames` frames; until then the previously
+    accepted count is returned. A face flickering in and out of a group
+    therefore never flips DETECTED/SHY/NEUTRAL at inference rate. The
+    window works like GestureConfirmer's.
+
+    Each update costs O(expired frames), whatever the window length.
+    """
+
+    def __init__(self, window=1.0, threshold=0.6, min_frames=3):
+        self.window = window
+        self.threshold = threshold
+        self.min_frames = min_frames
+
+        self._frames = deque()  # (t, count)
+        self._totals = Counter()  # count -> frames in the window showing it
+        self.count = None  # accepted count; None until the first one holds
+
+        self.results = 0
+        self.changes = 0
+
+    def update(self, t, count):
+        """Add one face count; returns the accepted count (None before the first is accepted)."""
+        self.results += 1
+        self._frames.append((t, count))
+        self._totals[count] += 1
+        while self._frames[0][0] <= t - self.window:
+            _, expired = self._frames.popleft()
+            self._totals[expired] -= 1
+            if not self._totals[expired]:
+                del self._totals[expired]
+
+        frames = len(self._frames)
+        if frames >= self.min_frames:
+            best, seen = max(self._totals.items(), key=lambda item: item[1])
+            if best != self.count and seen >= self.threshold * frames:
+                self.count = best
+                self.changes += 1
+        return self.count
@@ -1,62 +1,76 @@
+import os
+import signal
+import sys
 import time
+import threading
 import cv2
-import random
 import mediapipe as mp
 from mediapipe.tasks import python
 from mediapipe.tasks.python import vision
-from flask import Flask, Response
-from picamera2 import Picamera2
-import serial
 
-# Flask App for Streaming
-app = Flask(__name__)
+# NOMO_CAMERA=synthetic (or a video file) runs without the Pi camera, see synthetic_camera.py
+if os.environ.get("NOMO_CAMERA"):
+    from synthetic_camera import SyntheticCamera as Picamera2
+else:
+    from picamera2 import Picamera2
+
+from command_dispatcher import CommandDispatcher
+from frame_broadcast import FrameBroadcaster
+from frame_capture import FrameCapture, RGBConverter, configure_camera
+from frame_pool import peak_rss_mb
+from gesture_confirmer import GestureConfirmer
+from inference_scheduler import InferenceScheduler
+from interaction_fsm import STATES, Gesture, InteractionFSM, InteractionRunner, Location, LocationReply, PeopleCount
+from latency_trace import LatencyTracer
+from people_confirmer import PeopleCountConfirmer
+from metrics import CONTENT_TYPE, MetricsPage, RateMeter
+from result_channel import ResultChannel
+from result_fusion import FrameFusion
+from serial_link import AckEvent, LocationEvent, SerialLink
+from session_trace import TraceRecorder, face_detections, hand_gestures
+from stream_server import EventFeed, StreamServer
+
+FACE_MODEL = os.environ.get("NOMO_FACE_MODEL", "/home/sripranav/Desktop/pi_camera/detector.tflite")
+GESTURE_MODEL = os.environ.get("NOMO_GESTURE_MODEL", "/home/sripranav/Desktop/pi_camera/gesture_recognizer.task")
 
 # ** GLOBAL VARIABLES **
-FACE_DETECTION_RESULT = None
-GESTURE_RESULT_LIST = []
-FRAME_COUNTER = 0  # For skipping frames
-
-#Flags
-study_mode_active = False
-standby_mode_active = False
-check_for_people = False
+# Latest face/gesture results, tagged with the frame they answer (written by the MediaPipe callbacks)
+results = ResultChannel(models=("face", "gesture"))
+MAX_RESULT_AGE_MS = 500  # older results are not drawn
+
+# Paces frame submission to the measured face/gesture inference latency
+scheduler = InferenceScheduler(models=("face", "gesture"))
+# Votes over the last second of recognizer results before a gesture counts (fed by on_observation).
+# A Pi 4 runs both models at about 5 fps or less, so a shorter window rarely sees min_frames results.
+gesture_confirmer = GestureConfirmer(window=1.0, threshold=0.6, min_frames=3)
+# A face count must make up most of the last second before the FSM sees a change (fed by on_observation)
+people_confirmer = PeopleCountConfirmer(window=1.0, threshold=0.6, min_frames=3)
+
+# Last gesture the confirmer accepted, as (name, time.monotonic()) (written by on_observation)
+last_gesture = None
+
+# Last command queued for the Arduino (send_command skips repeats). Checked and set on the
+# FSM thread, cleared by location replies on the serial reader thread: hold the lock for both
 previous_command = None
+previous_command_lock = threading.Lock()
 
-break_first_nudge_sent = False
-break_second_nudge_sent = False
-study_first_nudge_sent = False
-study_second_nudge_sent = False
+FPS = 0
+# NOMO_HEADLESS=1: publish frames as captured and leave the overlays to /nomo/viewer (no drawing on the Pi)
+HEADLESS = os.environ.get("NOMO_HEADLESS") == "1"
+STATS_INTERVAL = 60  # seconds between frame/memory reports
 
-# Timers
-break_start_time = None
-study_start_time = None
-alone_timer_start = None  # Track when no one is detected
-
-look_state = None
-look_start_time = 0
-LOOK_DURATION = 2  # how many seconds you want to spend "looking"
-
-wave_last_time = None
-WAVE_COOLDOWN = 3  # seconds
-
-# Counters
-closed_fist_counter = 0
-thumb_up_counter = 0
-previous_num_people = 0
-
-COUNTER, FPS = 0, 0
-START_TIME = time.time()
-LOG_TIMER = time.time()  # Timer for reducing log frequency
 # ** END OF GLOBAL VARIABLES **
 
-# Serial variables
-ser = serial.Serial("/dev/ttyACM0", 115200, timeout=1)
-# Vairables for pyserial
-ser.setDTR(False)
-time.sleep(1)
-ser.flushInput()
-ser.setDTR(True)
-time.sleep(2)
+# Serial link to the Arduino (newline-framed, sequenced and acknowledged commands)
+# NOMO_SERIAL_PORT can point at a virtual_arduino.py pty to run without the board
+link = SerialLink.open(os.environ.get("NOMO_SERIAL_PORT", "/dev/ttyACM0"), 115200)
+# All serial I/O happens on the dispatcher's thread; the vision loop only queues commands
+# Per-frame latency from sensor exposure through inference and the FSM to the Arduino's ACK
+tracer = LatencyTracer()
+dispatcher = CommandDispatcher(link, tracer=tracer).start()
+
+# NOMO_TRACE=session.ndjson.gz records detections, serial lines and commands for replay_trace.py
+trace = TraceRecorder(os.environ["NOMO_TRACE"]) if os.environ.get("NOMO_TRACE") else None
 
 # Initialize MediaPipe utilities
 mp_drawing = mp.solutions.drawing_utils
@@ -64,21 +78,60 @@ mp_drawing_styles = mp.solutions.drawing_styles
 
 # Callback for Face Detection
 def face_callback(result: vision.FaceDetectorResult, unused_output_image: mp.Image, timestamp_ms: int):
-    global FACE_DETECTION_RESULT
-    FACE_DETECTION_RESULT = result
+    results.put("face", timestamp_ms, result)
+    scheduler.complete("face", timestamp_ms)
+    tracer.mark(timestamp_ms, "face")
+    fusion.put("face", timestamp_ms, result)
+    if trace:
+        trace.record("face", ts=timestamp_ms, detections=face_detections(result))
 
 # Callback for Gesture Recognition
 def gesture_callback(result: vision.GestureRecognizerResult, unused_output_image: mp.Image, timestamp_ms: int):
-    global GESTURE_RESULT_LIST
-    GESTURE_RESULT_LIST.append(result)
+    results.put("gesture", timestamp_ms, result)
+    scheduler.complete("gesture", timestamp_ms)
+    tracer.mark(timestamp_ms, "gesture")
+    fusion.put("gesture", timestamp_ms, result)
+    if trace:
+        trace.record("gesture", ts=timestamp_ms, hands=hand_gestures(result))
+
+# One face + gesture observation per frame: people count and gestures always come from the same moment
+def on_observation(observation):
+    global last_gesture
+    now = time.monotonic()
+    frame_ms = observation.timestamp_ms
+    tracer.mark(frame_ms, "fused")
+    face, gesture = observation.results["face"], observation.results["gesture"]
+    if face is not None:
+        people = people_confirmer.update(now, len(face.detections))
+        if people is not None:
+            interaction_runner.post(PeopleCount(people, now, frame_ms))
+    # Vote only on the recognizer's own answer to this frame: a result borrowed from a
+    # neighbouring frame (FrameFusion's tolerance) has already been counted there
+    if gesture is not None and observation.sources_ms["gesture"] == frame_ms:
+        confirmed = gesture_confirmer.update(now, hand_gestures(gesture))
+        if confirmed:
+            last_gesture = (confirmed, now)
+            interaction_runner.post(Gesture(confirmed, now, frame_ms))
+
+fusion = FrameFusion(on_observation, models=("face", "gesture"), tolerance_ms=100)
 
 # Initialize Picamera2
 picam2 = Picamera2()
-# picam2.configure(picam2.create_video_configuration(main={"size": (640, 480), "format": "RGB888"})) # Low resolution
-picam2.configure(picam2.create_video_configuration(main={"size": (960, 540), "format": "RGB888"})) # Medium resolution
-# picam2.configure(picam2.create_video_configuration(main={"size": (1280, 720), "format": "RGB888"})) # HD resolution
+# MAIN_SIZE = (640, 480) # Low resolution
+MAIN_SIZE = (960, 540) # Medium resolution
+# MAIN_SIZE = (1280, 720) # HD resolution
+# Detectors run on a separate low-res stream close to the models' input (None = use the main stream)
+LORES_SIZE = (384, 216)
+# "YUV420" works on every Pi; on a Pi 5 use "BGR888" (RGB byte order) to skip the colour conversion entirely
+LORES_FORMAT = "YUV420"
+configure_camera(picam2, MAIN_SIZE, LORES_SIZE, LORES_FORMAT)
 picam2.start()
 
+# Capture runs on its own thread; the loop below always pulls the newest frame
+capture = FrameCapture(picam2).start()
+# Hands MediaPipe an RGB view of each frame without allocating a new array per frame
+rgb_converter = RGBConverter(capture)
+
 # Function to send commands to Arduino only when there is a change
 # def send_command(command):
 #     global previous_command
@@ -87,22 +140,91 @@ picam2.start()
 #         print(f"Sent to Arduino: {command}")
 #         previous_command = command  # Update last sent command
 
-def send_command(command):
+# Commands are queued on the dispatcher and never block the vision loop.
+# hold: seconds before the next command may go out (e.g. while an animation plays)
+# repeat: send even if it matches the previous command (e.g. repeated waves)
+# frame_ms: the detection the FSM was handling (None for timers and locations), for the latency trace
+def send_command(command, hold=0.0, repeat=False, frame_ms=None):
     global previous_command
-    if ser is None:
+    if link is None:
         print(f"WARNING: Serial port not available. Skipping command: {command}")
         return  # Skip sending if no connection
 
-    if command != previous_command:
-        ser.flushInput()  # Clear any buffered input before sending new data
-        ser.write(command)  # Send command to Arduino
-        ser.flush()  # Ensure the command is sent immediately
-        print(f"Sent to Arduino: {command}")
-        previous_command = command  # Update last sent command
-
-# Function to generate frames with detection and logging
-def generate_frames(face_model: str, gesture_model: str, skip_frames: int = 3):
-    global FRAME_COUNTER, closed_fist_counter, alone_timer_start, FPS, COUNTER, START_TIME, LOG_TIMER, previous_num_people, thumb_up_counter, check_for_people, study_mode_active, standby_mode_active, break_start_time, study_start_time, break_first_nudge_sent, break_second_nudge_sent, study_first_nudge_sent, study_second_nudge_sent, previous_command, LOOK_DURATION, look_start_time, look_state, wave_last_time, WAVE_COOLDOWN
+    if not repeat:
+        with previous_command_lock:
+            if command == previous_command:
+                return
+            previous_command = command  # Update last sent command
+    # Commands decided on a detection carry that frame's latency trace
+    tracer.mark(frame_ms, "decided")
+    dispatcher.send(command, hold=hold, trace=frame_ms)
+    if trace:
+        trace.record("command", cmd=command.decode())
+
+# Ask the Arduino where it is; the reply goes back to the interaction FSM when it arrives
+def request_location(purpose):
+    global previous_command
+    if link is None:
+        return
+
+    # Skipped only while an earlier CHECK_LOCATION is still waiting for its reply
+    with previous_command_lock:
+        if previous_command == b'CHECK_LOCATION':
+            return
+        # Set before queuing, so a fast reply clears it rather than being overwritten
+        previous_command = b'CHECK_LOCATION'
+    dispatcher.request(b'CHECK_LOCATION', then=lambda reply: on_location_reply(purpose, reply))
+    if trace:
+        trace.record("command", cmd="CHECK_LOCATION")
+
+# Runs on the serial reader thread with the board's answer, or on the dispatcher thread with None
+# if it timed out; the FSM gets it through its runner's queue
+def on_location_reply(purpose, reply):
+    global previous_command
+    # Answered or given up on: the next CHECK_LOCATION (e.g. the FSM's retry) must go out
+    with previous_command_lock:
+        if previous_command == b'CHECK_LOCATION':
+            previous_command = None
+    interaction_runner.post(LocationReply(purpose, reply, time.monotonic()))
+
+# Study/break/standby behaviour; reacts to each detection, location and timer event as it arrives
+interaction = InteractionFSM(send_command, request_location)
+interaction_runner = InteractionRunner(interaction)
+# Start only once the global exists: the runner's first act sends STANDBY, and callbacks post to it
+interaction_runner.start()
+
+# Runs on the serial reader thread for every line the board sends
+def on_serial_event(event):
+    if isinstance(event, LocationEvent):
+        interaction_runner.post(Location(event.location, event.timestamp))
+    if trace:
+        if isinstance(event, AckEvent):
+            trace.record("ack", event.timestamp, seq=event.seq, ok=event.ok)
+        else:
+            trace.record("serial", event.timestamp,
+                         line=event.location if isinstance(event, LocationEvent) else event.text)
+
+link.subscribe(on_serial_event)
+
+# Every /nomo viewer reads the frames published by the single pipeline thread
+broadcaster = FrameBroadcaster()
+# Per-frame face boxes, gestures and FSM state for /nomo/events, keyed by the same frame id as the stream
+detections = EventFeed(event="detections")
+pipeline_thread = None
+pipeline_lock = threading.Lock()
+
+# Start the vision pipeline once; it owns the camera, the models and the interaction state
+def start_pipeline():
+    global pipeline_thread
+    with pipeline_lock:
+        if pipeline_thread is None:
+            pipeline_thread = threading.Thread(target=run_pipeline, args=(FACE_MODEL, GESTURE_MODEL),
+                                               name="VisionPipeline", daemon=True)
+            pipeline_thread.start()
+
+# Vision pipeline: detection, interaction logic and frame publishing
+def run_pipeline(face_model: str, gesture_model: str):
+    global FPS
 
     # Initialize Face Detection
     face_base_options = python.BaseOptions(model_asset_path=face_model)
@@ -129,355 +251,247 @@ def generate_frames(face_model: str, gesture_model: str, skip_frames: int = 3):
     gesture_recognizer = vision.GestureRecognizer.create_from_options(gesture_options)
 
     # Variables
-    update_interval = 1 # Interval variable for logging and actions in seconds, earlier #2
-    last_gesture = None
-    gesture_timer = time.time()  # Timer to manage gesture debounce duration
+    stats_timer = time.time()
 
+    captured = None
     while True:
-        # Capture frame using Picamera2
-        frame = picam2.capture_array()
-
-        # Frame Skipping to reduce load
-        FRAME_COUNTER += 1
-        if FRAME_COUNTER % skip_frames != 0:
-            continue
-
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
+        # Only submit once both models have answered the previous frame, so no
+        # backlog builds up inside detect_async/recognize_async
+        scheduler.wait_ready()
+
+        # Newest frame from the capture thread (stale frames are dropped, not queued)
+        captured = capture.latest(previous=captured)
+        if captured is None:
+            # Without a timeout latest() only returns None once capture has stopped
+            print("ERROR: Frame capture stopped; vision pipeline exiting.")
+            break
+        dequeued_ns = time.monotonic_ns()
+        frame = captured.frame
+
+        rgb_frame = rgb_converter.convert(captured)
+        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame.array)
+        # mp.Image holds its own copy of the pixels, so the RGB buffer can go back to the pool
+        inference_shape = rgb_frame.array.shape
+        rgb_frame.release()
+
+        # Both models get the same timestamp for the same image
+        timestamp_ms = scheduler.next_timestamp_ms()
+        scheduler.submit(timestamp_ms)
+        tracer.begin(timestamp_ms, sensor=captured.sensor_ns, captured=int(captured.timestamp * 1e9),
+                     dequeued=dequeued_ns, submitted=time.monotonic_ns())
+        if trace:
+            trace.record("frame", ts=timestamp_ms, seq=captured.seq, capture=captured.timestamp,
+                         sensor_ns=captured.sensor_ns)
 
         # Run Face Detection
-        face_detector.detect_async(mp_image, time.time_ns() // 1_000_000)
+        face_detector.detect_async(mp_image, timestamp_ms)
 
         # Run Gesture Recognition
-        gesture_recognizer.recognize_async(mp_image, time.time_ns() // 1_000_000)
-
-        # Count Detected Faces
-        num_people = len(FACE_DETECTION_RESULT.detections) if FACE_DETECTION_RESULT else 0
+        gesture_recognizer.recognize_async(mp_image, timestamp_ms)
 
-        # Detect Gestures
+        # Newest results that are still fresh; stale ones are not drawn
+        face = results.latest("face", max_age_ms=MAX_RESULT_AGE_MS)
+        gesture = results.latest("gesture", max_age_ms=MAX_RESULT_AGE_MS)
         gesture_detected = None
-        if GESTURE_RESULT_LIST:
-            for gesture_result in GESTURE_RESULT_LIST:
-                if gesture_result.gestures:
-                    current_gesture = gesture_result.gestures[0][0].category_name
-                    if current_gesture != last_gesture and time.time() - gesture_timer > update_interval:
-                        last_gesture = current_gesture
-                        gesture_timer = time.time()  # Reset timer
-                    gesture_detected = current_gesture
-                    break
-            GESTURE_RESULT_LIST.clear()
-
-        
-        # Interaction Logic (State-Based Logging)
-        if time.time() - LOG_TIMER > update_interval:
-            # Maintain current location if no new data is received
-            try:
-                # Uncomment
-                if ser.in_waiting:
-                    current_location = ser.readline().decode().strip()
-                    print(f"Detected: {current_location}")
-                else:
-                    current_location = current_location if 'current_location' in locals() else "Nowhere"
-                    # current_location = current_location if 'current_location' in locals() else "BLUE"
-            except Exception as e:
-                print(f"Serial read error: {e}")
-                current_location = "Nowhere"
-            
-            # Determine current state based on number of people
-            current_num_people = num_people
-            # print(current_num_people, num_people)
-            
-            # Detecting a change in people and reacting accordingly
-            if current_num_people != previous_num_people:
-                # 1) Takes precedence – people are detected
-                if previous_num_people == 0 and current_num_people > 0 and not study_mode_active:
-                    send_command(b'DETECTED') # Only works once because of the send_command logic
-                    time.sleep(1.5)
-                # 2) Be shy (Universal - is activated during study mode too)
-                elif current_num_people >= 3:
-                    send_command(b'SHY')
-                # 3) If expected people, normal position
-                elif current_num_people < 3 and current_num_people > 0:
-                    send_command(b'NEUTRAL') # Command to Arduino to make the servo come back to normal.
-                previous_num_people = current_num_people  # Update previous state
-                
-                # Reset flags because they were triggered when there were 0 people, but now there is atleast a positive change
-                if current_num_people > 0:
-                    alone_timer_start = None
-                    check_for_people = False
-                
-                # if current_num_people < 3 and current_num_people > 0:
-                #     send_command(b'NEUTRAL') # Command to Arduino to make the servo come back to normal.
-                # previous_num_people = current_num_people  # Update previous state
-
-            # If people are 0, then trigger the alone timer
-            if current_num_people == 0:
-                if not gesture_detected and alone_timer_start is None:
-                    alone_timer_start = time.time()
-                elif alone_timer_start is not None and time.time() - alone_timer_start > 15:
-                    check_for_people = True
-                    alone_timer_start = None # Reset alone timer - because action triggered
-            else: 
-                alone_timer_start = None
-                check_for_people = False
-                
-            
-            # Detecting Gestures for Study Mode Activation and Extension
-            if gesture_detected == "Closed_Fist":
-                if closed_fist_counter == 2:
-                    if study_mode_active:
-                        if current_location == "BLUE":
-                            send_command(b'EXTEND_STUDY')
-                            study_start_time = time.time()
-                            #Reset break related flags
-                            break_first_nudge_sent = False
-                            break_second_nudge_sent = False
-                            break_start_time = None  # Reset break tracking
-                            break_location = None
-                        
-                        # Study mode already active, this means they are on a break
-                        elif current_location in ("PURPLE", "YELLOW"):
-                            send_command(b'EXTEND_BREAK')
-                            break_start_time = time.time()
-                            # Reset back to study related flags
-                            study_first_nudge_sent = False
-                            study_second_nudge_sent = False
-                            study_start_time = None  # Reset study tracking
-                    else:
-                        if current_location == "BLUE":
-                            send_command(b'STUDY')
-                            study_mode_active = True
-                            study_start_time = time.time()
-                            
-                            # Reset for a fresh study session
-                            break_first_nudge_sent = False
-                            break_second_nudge_sent = False
-                            break_start_time = None
-                            break_location = None
-                            study_first_nudge_sent = False
-                            study_second_nudge_sent = False
-                        else:
-                            send_command(b'MOVE_TO_DESK')
-                    closed_fist_counter = 0
-                else:
-                    closed_fist_counter += 1
-            
-            # Study Mode Logic
-            if study_mode_active:
-                
-                standby_mode_active = False
-                
-                # DURING STUDY
-                if break_start_time is None:
-                    elapsed_study_time = time.time() - study_start_time
-
-                
-                if elapsed_study_time > 40 and not break_first_nudge_sent: # 1 min for the capstone showcase
-                    break_location = random.choice(["PURPLE", "YELLOW"])
-                    # Nudge 1
-                    send_command(f'BREAK_{break_location.upper()}'.encode())
-                    break_first_nudge_sent = True # Mark the first nudge sent
-
-                # Might be handled by Arduino. Pi will send a signal for second nudge check
-                if elapsed_study_time > 70 and not break_second_nudge_sent:
-                    send_command(b'CHECK_LOCATION')
-                    time.sleep(1) # Request location and get it back
-                    if current_location == "BLUE":
-                        # Nudge 2 - Sound
-                        send_command(b'SECOND_BREAK_NUDGE')
-                        break_second_nudge_sent = True # Mark the first nudge sent
-                    elif current_location not in ("PURPLE", "YELLOW", "BLUE"):
-                        pass # the robot is being transported
-
-                # Check if the break_location is reached - MIGHT BE HANDlED BY ARDUINO
-                if break_first_nudge_sent and break_start_time is None: 
-                    if current_location == break_location:
-                        # print("Break location reached, starting break time")
-                        break_start_time = time.time()
-                        study_start_time = None # Reset study time during the break
-                        # resetting from the last study session
-                        # study_first_nudge_sent = False
-                        # study_second_nudge_sent = False
-        
-                # DURING BREAK
-                if break_start_time is not None and (time.time() - break_start_time > 20) and not study_first_nudge_sent: # 80 TBC
-                    if current_location != "BLUE":
-                        send_command(b'BACK_TO_STUDY') # Denote to be taken back
-                    study_first_nudge_sent = True
-
-                # work - requst location only once after its done
-                if break_start_time is not None and (time.time() - break_start_time > 30) and not study_second_nudge_sent:  
-                    send_command(b'CHECK_LOCATION')
-                    study_second_nudge_sent = True
-                    time.sleep(2)
-                    if current_location == break_location:
-                        # Nudge 2 - Sound
-                        send_command(b'SECOND_STUDY_NUDGE')
-                        break_second_nudge_sent = True # Mark the first nudge sent
-                    elif current_location not in ("PURPLE", "YELLOW", "BLUE"):
-                        pass # the robot is being transported
-
-                # Check if the study_location is reached - Might be handled by the Arduino
-                if study_first_nudge_sent:
-                    if current_location == "BLUE": # Taken back to desk - all good
-                        send_command(b'STUDY_RESTART')
-                        
-                        break_start_time = None # Reset break start time because
-                        study_start_time = time.time()
-                        # Reset the flags for next break
-                        break_first_nudge_sent = False
-                        break_second_nudge_sent = False
-                        study_first_nudge_sent = False
-                        study_second_nudge_sent = False
-                        break_location = None # Resets break location
-        
-                # Quit Study Mode
-                if gesture_detected == "Thumb_Up":
-                    if thumb_up_counter == 2:
-                        study_mode_active = False
-                        print('Study Mode DEACTIVATED')
-                        thumb_up_counter = 0
-                    
-                    else:
-                        thumb_up_counter+=1
-              
-            # Standby Mode Logic
-            if not study_mode_active:
-                # Make sure we are only sending the standby mode once
-                if not standby_mode_active:
-                    send_command(b'STANDBY')
-                    standby_mode_active = True
-                    
-                # if current_location == "Nowhere":
-                #     send_command(b'STANDBY')
-                # else:
-                #     color_mapping = {"Desk": b"ST_B", "Armchair": b"ST_P", "Table": b"ST_Y"}
-                #     send_command(color_mapping.get(current_location, b"ST_W"))
-
-                if gesture_detected == "Open_Palm":
-                    if wave_last_time is None or (time.time() - wave_last_time >= WAVE_COOLDOWN):
-                        # To ingore flush and input on the send_command function
-                        wave_last_time = time.time()
-                        ser.write(b'WAVE')
-                        print("Sent to Arduino: b'WAVE'")
-
-                '''
-                if check_for_people:
-                    send_command(b'LOOK_LEFT')
-                    time.sleep(2)
-                    if current_num_people > 0:
-                        send_command(b'SOUND')
-                        send_command(b'NEUTRAL')
-                        alone_timer_start = None
-                    else:
-                        send_command(b'LOOK_RIGHT')
-                        time.sleep(2)
-                        if current_num_people > 0:
-                            send_command(b'SOUND')
-                            send_command(b'NEUTRAL')
-                            alone_timer_start = None
-                        else:
-                            send_command(b'NEUTRAL')
-                            alone_timer_start = time.time()
-                    
-                    check_for_people = False # Reset timer
-                    '''
-                # 1) If we just set check_for_people and we have no "look" in progress:
-                if check_for_people and look_state is None:
-                    # Start by looking left
-                    send_command(b'LOOK_LEFT')
-                    look_state = 'looking_left'
-                    look_start_time = time.time()
-                    check_for_people = False  # We’ve now started the "look" sequence, so we reset timer
-                
-                # 2) Currently looking left
-                if look_state == 'looking_left':
-                    if time.time() - look_start_time >= LOOK_DURATION:
-                        # We’ve finished the left-look "wait"
-                        if current_num_people > 0:
-                            # send_command(b'NEUTRAL')
-                            alone_timer_start = None
-                            look_state = None  # Done
-                        else:
-                            # No people found, look right
-                            send_command(b'LOOK_RIGHT')
-                            look_state = 'looking_right'
-                            look_start_time = time.time()
-                
-                # 3) If we are currently looking right...
-                if look_state == 'looking_right':
-                    if time.time() - look_start_time >= LOOK_DURATION:
-                        if current_num_people > 0:
-                            # send_command(b'NEUTRAL')
-                            alone_timer_start = None
-                        else:
-                            send_command(b'NEUTRAL')
-                            alone_timer_start = time.time()
-                        look_state = None  # Done
-
-            
-            LOG_TIMER = time.time()
-                    
-            # if num_people == 0:
-            #     # Start the "alone" timer if it hasn't started yet
-            #     if  not gesture_detected and alone_timer_start is None:
-            #         alone_timer_start = time.time()
-                
-            #     # Someone is hiding?
-            #     elif gesture_detected:
-            #         print(f"\n{gesture_detected} detected. Where's your face human? \nAre you a ghost?")
-            #         alone_timer_start = None
-
-            #     # Check if 10 seconds have elapsed since the "alone" timer started
-            #     elif alone_timer_start is not None and time.time() - alone_timer_start > 10:
-            #         print("\nWhere's everyone? \nI need people! Talk to me!")
-            #         alone_timer_start = None  # Reset the timer once the message is displayed
-            # else:
-            #     # Reset the "alone" timer once people are detected
-            #     alone_timer_start = None
-            #     if num_people >= 3:
-            #         print(f"{num_people} people detected! \nMoving back and closing eyes.")
-            #     elif (num_people < 3 and num_people > 0) and gesture_detected == "Open_Palm":
-            #         print(f"{num_people} people detected with an open palm! \nWaving Back! Hii!")
-            #     elif (num_people < 3 and num_people > 0) and gesture_detected == "Thumb_Up":
-            #         print(f"{num_people} people detected with a thumbs-up! \nCheers!")
-            #     elif (num_people < 3 and num_people > 0) and gesture_detected == "Closed_Fist":
-            #         if closed_fist_counter == 1:
-            #             print(f"Starting desk mode!")
-            #             closed_fist_counter = 0
-            #         else:
-            #             print(f"{num_people} people detected with closed fist. \nChecking for desk mode.")
-            #             closed_fist_counter += 1
-            #     elif num_people > 0:
-            #         print(f"{num_people} people detected. Awaiting interaction...")
-            #     else:
-            #         continue
-            # LOG_TIMER = time.time()
-
-        # Draw Bounding Boxes
-        if FACE_DETECTION_RESULT:
-            for detection in FACE_DETECTION_RESULT.detections:
-                bbox = detection.bounding_box
-                start_point = (int(bbox.origin_x), int(bbox.origin_y))
-                end_point = (int(bbox.origin_x + bbox.width), int(bbox.origin_y + bbox.height))
-                cv2.rectangle(frame, start_point, end_point, (0, 255, 0), 2)
-                cv2.putText(frame, "Face", (start_point[0], start_point[1] - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-
-        if gesture_detected:
-            cv2.putText(frame, f"Gesture: {gesture_detected}", (10, 50),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-
-        # Convert to MJPEG Streaming Format
-        _, buffer = cv2.imencode('.jpg', frame)
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-
-# Flask Route for Video Streaming
-@app.route('/nomo')
-def nomo():
-    return Response(generate_frames("/home/sripranav/Desktop/pi_camera/detector.tflite", "/home/sripranav/Desktop/pi_camera/gesture_recognizer.task", skip_frames=3), mimetype='multipart/x-mixed-replace; boundary=frame')
-
-# Start Flask Server
+        if gesture and gesture.result.gestures:
+            gesture_detected = gesture.result.gestures[0][0].category_name
+
+        # Effective inference rate, as paced by the scheduler
+        FPS = scheduler.fps
+        # Wall-clock capture time, so viewers can tell how old a frame is when it arrives
+        captured_at = time.time() - (time.monotonic() - captured.timestamp)
+
+        # What the overlays show, for browsers that draw them (face boxes in inference-frame pixels)
+        if detections.wanted:
+            detections.publish({
+                "frame": timestamp_ms,
+                "t": round(captured_at, 3),
+                "size": [inference_shape[1], inference_shape[0]],
+                "faces": face_detections(face.result) if face else [],
+                "face_frame": face.timestamp_ms if face else None,
+                "hands": hand_gestures(gesture.result) if gesture else [],
+                "gesture_frame": gesture.timestamp_ms if gesture else None,
+                "state": interaction.state,
+                "fps": round(FPS, 1),
+            }, id=timestamp_ms)
+
+        if not HEADLESS:
+            # Draw Bounding Boxes (face boxes are in inference-frame pixels, rescale onto the display frame)
+            if face:
+                scale_x = frame.shape[1] / inference_shape[1]
+                scale_y = frame.shape[0] / inference_shape[0]
+                for detection in face.result.detections:
+                    bbox = detection.bounding_box
+                    start_point = (int(bbox.origin_x * scale_x), int(bbox.origin_y * scale_y))
+                    end_point = (int((bbox.origin_x + bbox.width) * scale_x),
+                                 int((bbox.origin_y + bbox.height) * scale_y))
+                    cv2.rectangle(frame, start_point, end_point, (0, 255, 0), 2)
+                    cv2.putText(frame, "Face", (start_point[0], start_point[1] - 10),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+
+            if gesture_detected:
+                cv2.putText(frame, f"Gesture: {gesture_detected}", (10, 50),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+
+            cv2.putText(frame, f"State: {interaction.state}", (10, 70),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 255), 2)
+
+            cv2.putText(frame, f"Inference FPS: {FPS:.1f}", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+
+        # Memory report: pooled buffer allocations should stay flat over long runs
+        if time.time() - stats_timer > STATS_INTERVAL:
+            pools = list(capture.pools.values()) + ([rgb_converter.pool] if rgb_converter.pool else [])
+            allocations = sum(pool.allocations for pool in pools)
+            print(f"Frames captured: {capture.frames_captured}, dropped: {capture.frames_dropped}, "
+                  f"buffer allocations: {allocations} "
+                  f"({allocations / max(capture.frames_captured, 1):.4f}/frame), "
+                  f"peak RSS: {peak_rss_mb():.1f} MB, stale results skipped: {results.stale_reads}")
+            lag = ", ".join(f"{model} {lag_ms:.0f} ms" for model, lag_ms in fusion.lag_ms.items() if lag_ms is not None)
+            print(f"Observations: {fusion.observations} (filled {fusion.filled}, missing {fusion.missing}, "
+                  f"late {fusion.late}), model lag: {lag}, behind: {fusion.behind_ms}")
+            for stage, latency in tracer.summary().items():
+                print(f"Latency {stage}: p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+                      f"p99 {latency['p99']} ms (n={latency['n']})")
+            stats_timer = time.time()
+
+        # Encode once per quality tier in use (not at all unless someone is watching or wants a snapshot)
+        if broadcaster.wanted:
+            broadcaster.publish_frame(frame, captured_at, frame_id=timestamp_ms)
+
+# Rates between scrapes of the counters below
+rates = RateMeter()
+
+# Builds the /metrics page from counters the pipeline already keeps; takes none of its locks
+def render_metrics():
+    page = MetricsPage()
+    page.counter("frames_captured", "Frames copied out of the camera.", capture.frames_captured)
+    page.counter("frames_dropped", "Captured frames replaced before the pipeline took them.", capture.frames_dropped)
+    page.gauge("capture_fps", "Camera frame rate over the last scrapes.",
+               rates.rate("captured", capture.frames_captured))
+    page.counter("frames_submitted", "Frames handed to the models.", scheduler.frames_submitted)
+    page.counter("inference_stalls", "Frames given up on after a model failed to answer.", scheduler.stalls)
+    page.gauge("inference_fps", "Frames both models answered per second (scheduler pacing).", scheduler.fps)
+    for model, received in results.received.items():
+        page.counter("inference_results", "Results received from each model.", received, {"model": model})
+    for model, received in results.received.items():
+        page.gauge("model_fps", "Results per second from each model over the last scrapes.",
+                   rates.rate(("results", model), received), {"model": model})
+    for model, latency_ms in scheduler.latency_ms.items():
+        page.gauge("model_latency_seconds", "Smoothed submit-to-callback latency per model.",
+                   latency_ms / 1000, {"model": model})
+    for model, lag_ms in fusion.lag_ms.items():
+        page.gauge("model_lag_seconds", "Smoothed frame-timestamp-to-result delay per model.",
+                   None if lag_ms is None else lag_ms / 1000, {"model": model})
+
+    page.gauge("fusion_pending_frames", "Frames waiting for the other model's result.", fusion.pending)
+    page.gauge("interaction_queue_depth", "Events posted to the interaction FSM and not yet handled.",
+               interaction_runner.pending)
+    page.gauge("command_queue_depth", "Commands queued for the Arduino and not yet written.", dispatcher.pending)
+    page.counter("observations", "Fused face and gesture observations.", fusion.observations)
+    page.counter("people_count_changes", "Times the smoothed people count changed.", people_confirmer.changes)
+    page.counter("stale_result_reads", "Overlay reads that found only results past MAX_RESULT_AGE_MS.",
+                 results.stale_reads)
+
+    page.gauge("stream_clients", "Connected /nomo viewers.", broadcaster.subscribers)
+    for tier, clients in zip(broadcaster.tiers, broadcaster.tier_clients):
+        page.gauge("stream_tier_clients", "Viewers on each JPEG quality tier.", clients, {"tier": tier.name})
+    page.counter("stream_frames_skipped", "Frames viewers skipped because they were still writing.",
+                 broadcaster.frames_skipped)
+    page.counter("http_requests", "Requests handled by the HTTP front end.", server.requests)
+    page.counter("snapshots", "Snapshot requests, by whether a frame had to be encoded for them.",
+                 server.snapshots_cached, {"source": "cached"})
+    page.counter("snapshots", "Snapshot requests, by whether a frame had to be encoded for them.",
+                 server.snapshots_encoded, {"source": "encoded"})
+    page.gauge("event_clients", "Connected /nomo/events subscribers.", detections.subscribers)
+    page.counter("event_bytes", "Bytes of detection records published to /nomo/events.",
+                 detections.bytes_published)
+    page.histogram("jpeg_encode_seconds", "Time to resize and JPEG-encode one frame for one tier.",
+                   broadcaster.encode_ms)
+    for tier, frames in zip(broadcaster.tiers, broadcaster.frames_encoded):
+        page.counter("jpeg_frames", "Frames encoded per tier.", frames, {"tier": tier.name})
+    for tier, encoded in zip(broadcaster.tiers, broadcaster.bytes_encoded):
+        page.counter("jpeg_bytes", "Bytes of JPEG encoded per tier.", encoded, {"tier": tier.name})
+
+    page.counter("serial_commands_sent", "Commands written to the Arduino.", link.sent)
+    page.counter("serial_acks", "Commands the Arduino acknowledged, by outcome.", link.acked, {"outcome": "ack"})
+    page.counter("serial_acks", "Commands the Arduino acknowledged, by outcome.", link.nacked, {"outcome": "nack"})
+    page.counter("serial_acks", "Commands the Arduino acknowledged, by outcome.", link.timeouts,
+                 {"outcome": "timeout"})
+    page.counter("serial_reconnects", "Times the serial port was reopened.", link.reconnects)
+    page.summary("serial_ack_latency_seconds", "Write-to-ACK round trip of Arduino commands.",
+                 list(link.round_trips_ms), link.acked, link.round_trip_total_ms)
+
+    for state in STATES:
+        page.gauge("interaction_state", "Current interaction FSM state (1 for the active one).",
+                   interaction.state == state, {"state": state})
+    for stage, histogram in tracer.histograms.items():
+        page.histogram("stage_latency_seconds", "Per-frame latency of each pipeline stage.",
+                       histogram, {"stage": stage})
+    return page.render()
+
+# What /nomo/state reports: a few hundred bytes for dashboards that do not need the video
+def current_state():
+    now = time.monotonic()
+    face = results.latest("face", max_age_ms=MAX_RESULT_AGE_MS)
+    gesture = results.latest("gesture", max_age_ms=MAX_RESULT_AGE_MS)
+    detected = None
+    if gesture and gesture.result.gestures:
+        category = gesture.result.gestures[0][0]
+        detected = {"name": category.category_name, "score": round(category.score, 3)}
+    confirmed = last_gesture
+    return {
+        "time": time.time(),
+        "state": interaction.state,
+        "people": people_confirmer.count or 0,
+        "faces": len(face.result.detections) if face else 0,
+        "gesture": detected,
+        "confirmed_gesture": {"name": confirmed[0], "age": round(now - confirmed[1], 3)} if confirmed else None,
+        "location": interaction.location,
+        "break_location": interaction.break_location,
+        "studying": interaction.studying,
+        "timers": {name: round(remaining, 3) for name, remaining in interaction.timers_remaining(now).items()},
+        "inference_fps": round(scheduler.fps, 1),
+    }
+
+# NOMO_HTTP=flask: the previous thread-per-viewer Flask server, with the stream and /metrics only
+def flask_app():
+    from flask import Flask, Response, request
+    app = Flask(__name__)
+
+    @app.route('/nomo')
+    def nomo():
+        start_pipeline()
+        return Response(broadcaster.stream(sock=request.environ.get('werkzeug.socket')),
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+    return app
+
+# All viewers, snapshot and state polls and scrapes share one asyncio thread
+server = StreamServer(broadcaster, port=5000)
+server.add_stream('/nomo')
+server.add_snapshot('/nomo/snapshot.jpg')
+server.add_json('/nomo/state', current_state)
+server.add_events('/nomo/events', detections)
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'viewer.html'), 'rb') as viewer_page:
+    server.add_static('/nomo/viewer', viewer_page.read())
+server.add_text('/metrics', render_metrics, CONTENT_TYPE)
+
+# Start the HTTP server
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, threaded=True)
+    # systemd/kill stop us with SIGTERM: exit normally so the trace below is closed and readable
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # The robot runs whether or not anyone is watching the stream
+    start_pipeline()
+    try:
+        if os.environ.get("NOMO_HTTP") == "flask":
+            flask_app().run(host='0.0.0.0', port=5000, threaded=True)
+        else:
+            server.run()
+    finally:
+        if trace:
+            trace.close()
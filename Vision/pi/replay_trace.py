@@ -0,0 +1,113 @@
+"""Replays a session trace through the interaction FSM at full speed.
+
+Face and gesture records become the PeopleCount/Gesture events the live
+callbacks post (gestures through the same GestureConfirmer), serial location lines become Location events, and time runs
+on the simulation's virtual clock, so an hour-long field session replays in
+milliseconds. The commands the FSM sends are compared with the ones the trace
+recorded, or with a previous replay saved with --out:
+
+    NOMO_TRACE=session.ndjson.gz python piarduino_merge.py
+    python replay_trace.py session.ndjson.gz --out before.json
+    python replay_trace.py session.ndjson.gz --against before.json
+"""
+
+import argparse
+import contextlib
+import difflib
+import io
+import json
+import time
+
+from gesture_confirmer import GestureConfirmer
+from people_confirmer import PeopleCountConfirmer
+from session_trace import event_from_record, read_trace
+from simulate_session import Simulation
+
+
+def replay(records):
+    """Feed trace records to a fresh Simulation; returns (simulation, recorded commands)."""
+    # Records from different threads can reach the writer slightly out of order
+    records = sorted(records, key=lambda record: record["t"])
+    sim = Simulation(location=None)
+    confirmer = GestureConfirmer()
+    people = PeopleCountConfirmer()
+    recorded = []
+    start = records[0]["t"] if records else 0.0
+    for record in records:
+        t = record["t"] - start
+        if record["k"] == "command":
+            recorded.append((round(t, 3), record["cmd"]))
+            continue
+        event = event_from_record(record, confirmer, people)
+        if event is None:
+            continue
+        if record["k"] == "serial":
+            # Tracks the card location too, so CHECK_LOCATION is answered as the board did
+            sim.at(t, lambda location=event.location: sim.move_to(location))
+        else:
+            sim.at(t, event)
+    end = records[-1]["t"] - start if records else 0.0
+
+    # Break locations are picked at random; reuse the ones the live session picked
+    picks = iter([command.split("_")[1] for _, command in recorded if command.startswith("BREAK_")])
+    sim.fsm.choose = lambda options: next(picks, None) or sim.random.choice(options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(end)
+    return sim, recorded
+
+
+def compare(expected, actual):
+    """Match two (time, command) lists by command order; report where and how much they differ."""
+    names = difflib.SequenceMatcher(a=[c for _, c in expected], b=[c for _, c in actual], autojunk=False)
+    matched = 0
+    max_shift = 0.0
+    first_difference = None
+    for op, a0, a1, b0, b1 in names.get_opcodes():
+        if op == 'equal':
+            matched += a1 - a0
+            for (ta, _), (tb, _) in zip(expected[a0:a1], actual[b0:b1]):
+                max_shift = max(max_shift, abs(ta - tb))
+        elif first_difference is None:
+            first_difference = {"expected": expected[a0:a1][:5], "actual": actual[b0:b1][:5]}
+    return {"expected": len(expected), "actual": len(actual), "matched": matched,
+            "max_time_shift_s": round(max_shift, 3), "first_difference": first_difference}
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('trace', help='NDJSON trace (.gz allowed) written with NOMO_TRACE.')
+    parser.add_argument('--out', default=None, help='Save the replayed commands as JSON.')
+    parser.add_argument('--against', default=None,
+                        help='Compare with commands saved by an earlier --out instead of the recorded ones.')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    records = list(read_trace(args.trace))
+    loaded = time.perf_counter()
+    sim, recorded = replay(records)
+    done = time.perf_counter()
+
+    commands = [(t, command) for t, command, _ in sim.commands]
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(commands, f)
+    if args.against:
+        with open(args.against) as f:
+            expected = [tuple(item) for item in json.load(f)]
+    else:
+        expected = recorded
+
+    report = {
+        "records": len(records),
+        "events": sim.events,
+        "session_seconds": round(sim.clock.now, 3),
+        "load_seconds": round(loaded - start, 3),
+        "replay_seconds": round(done - loaded, 3),
+        "final_state": sim.fsm.state,
+        "commands": compare(expected, commands),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Bounded, lock-protected hand-off of MediaPipe LIVE_STREAM results to the vision loop."""
+
+import threading
+import time
+from collections import deque
+from typing import Any, NamedTuple
+
+
+class TaggedResult(NamedTuple):
+    timestamp_ms: int  # timestamp of the frame this result answers
+    result: Any
+
+
+def wall_clock_ms():
+    # The clock InferenceScheduler.next_timestamp_ms() stamps frames with
+    return time.time_ns() // 1_000_000
+
+
+class ResultChannel:
+    """Keeps the last `depth` results per model, tagged with their frame timestamp.
+
+    put() is called from MediaPipe's callback threads and never grows memory:
+    older results for a model are dropped as new ones arrive. Readers ask for
+    the latest result no older than a given age, or for the result of one
+    specific frame.
+    """
+
+    def __init__(self, models=("face", "gesture"), depth=4, clock_ms=wall_clock_ms):
+        self.clock_ms = clock_ms
+        self._lock = threading.Lock()
+        self._results = {model: deque(maxlen=depth) for model in models}
+        self.received = {model: 0 for model in models}
+        self.stale_reads = 0  # latest() calls that found only results past max_age_ms
+
+    def put(self, model, timestamp_ms, result):
+        with self._lock:
+            self._results[model].append(TaggedResult(timestamp_ms, result))
+            self.received[model] += 1
+
+    def latest(self, model, max_age_ms=None, now_ms=None):
+        """Newest result for `model`, or None if there is none younger than `max_age_ms`."""
+        if max_age_ms is not None and now_ms is None:
+            now_ms = self.clock_ms()
+        with self._lock:
+            results = self._results[model]
+            tagged = results[-1] if results else None
+            if tagged is None:
+                return None
+            # Counted under the lock: latest() is called from several threads
+            if max_age_ms is not None and now_ms - tagged.timestamp_ms > max_age_ms:
+                self.stale_reads += 1
+                return None
+        return tagged
+
+    def get(self, model, timestamp_ms):
+        """The result `model` produced for the frame stamped `timestamp_ms`, if still held."""
+        with self._lock:
+            for tagged in reversed(self._results[model]):
+                if tagged.timestamp_ms == timestamp_ms:
+                    return tagged
+        return None
+
+    def snapshot(self, model):
+        """All results currently held for `model`, oldest first."""
+        with self._lock:
+            return list(self._results[model])
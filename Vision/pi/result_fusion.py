@@ -0,0 +1,111 @@
+"""Joins the face and gesture results of each frame into one observation."""
+
+import threading
+from collections import deque
+from typing import Dict, NamedTuple, Optional
+
+from result_channel import wall_clock_ms
+
+
+class Observation(NamedTuple):
+    timestamp_ms: int  # the frame every result belongs to (or is nearest to)
+    results: Dict[str, object]  # model -> result, None if nothing close enough
+    sources_ms: Dict[str, Optional[int]]  # model -> timestamp of the frame its result answers
+
+
+class FrameFusion:
+    """Emits one Observation per frame timestamp once every model has answered it.
+
+    Results arrive per model on MediaPipe's callback threads, in frame order
+    for each model. A frame is emitted as soon as all models have answered
+    it, or once every missing model has moved on to later frames (or
+    `max_wait_ms` passed): missing results are then taken from that model's
+    nearest frame within `tolerance_ms`, else left as None. Observations come
+    out in timestamp order; on_observation runs under the fusion's lock on
+    the callback thread, so keep it short.
+
+    lag_ms: per model, smoothed delay from frame timestamp to result arrival.
+    behind_ms: per model, how far its newest answered frame trails the
+    newest frame any model has answered.
+    """
+
+    def __init__(self, on_observation, models=("face", "gesture"), tolerance_ms=100, max_wait_ms=500,
+                 depth=8, lag_alpha=0.2, clock_ms=wall_clock_ms):
+        self.on_observation = on_observation
+        self.models = tuple(models)
+        self.tolerance_ms = tolerance_ms
+        self.max_wait_ms = max_wait_ms
+        self.lag_alpha = lag_alpha
+        self.clock_ms = clock_ms
+
+        self._lock = threading.Lock()
+        self._pending = {}  # timestamp_ms -> {model: result}
+        self._recent = {model: deque(maxlen=depth) for model in self.models}  # (timestamp_ms, result)
+        self._newest = {model: None for model in self.models}
+        self._last_emitted = None
+
+        self.lag_ms = {model: None for model in self.models}
+        self.observations = 0
+        self.filled = 0  # results borrowed from a nearby frame
+        self.missing = 0  # results left as None
+        self.late = 0  # results for frames already emitted
+
+    @property
+    def behind_ms(self):
+        with self._lock:
+            answered = [ts for ts in self._newest.values() if ts is not None]
+            if not answered:
+                return {model: None for model in self.models}
+            newest = max(answered)
+            return {model: None if ts is None else newest - ts for model, ts in self._newest.items()}
+
+    @property
+    def pending(self):
+        """Frames some model has answered that are still waiting on the others."""
+        return len(self._pending)
+
+    def put(self, model, timestamp_ms, result, now_ms=None):
+        now_ms = self.clock_ms() if now_ms is None else now_ms
+        with self._lock:
+            lag = now_ms - timestamp_ms
+            previous = self.lag_ms[model]
+            self.lag_ms[model] = lag if previous is None else previous + self.lag_alpha * (lag - previous)
+            self._newest[model] = timestamp_ms if self._newest[model] is None else max(self._newest[model], timestamp_ms)
+            self._recent[model].append((timestamp_ms, result))
+
+            if self._last_emitted is not None and timestamp_ms <= self._last_emitted:
+                self.late += 1
+                return
+            self._pending.setdefault(timestamp_ms, {})[model] = result
+
+            for frame_ms in sorted(self._pending):
+                if not self._complete(frame_ms, now_ms):
+                    break  # later frames wait too, so observations stay in order
+                self._emit(frame_ms)
+
+    def _complete(self, frame_ms, now_ms):
+        answered = self._pending[frame_ms]
+        if len(answered) == len(self.models) or now_ms - frame_ms > self.max_wait_ms:
+            return True
+        # A model that has answered a later frame will not answer this one any more
+        return all(self._newest[model] is not None and self._newest[model] > frame_ms
+                   for model in self.models if model not in answered)
+
+    def _emit(self, frame_ms):
+        answered = self._pending.pop(frame_ms)
+        results = {}
+        sources = {}
+        for model in self.models:
+            if model in answered:
+                results[model], sources[model] = answered[model], frame_ms
+                continue
+            nearest = min(self._recent[model], key=lambda item: abs(item[0] - frame_ms), default=None)
+            if nearest is not None and abs(nearest[0] - frame_ms) <= self.tolerance_ms:
+                results[model], sources[model] = nearest[1], nearest[0]
+                self.filled += 1
+            else:
+                results[model], sources[model] = None, None
+                self.missing += 1
+        self._last_emitted = frame_ms
+        self.observations += 1
+        self.on_observation(Observation(frame_ms, results, sources))
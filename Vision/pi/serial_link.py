@@ -0,0 +1,241 @@
+"""Framed, acknowledged command channel between the Pi and the Arduino.
+
+Every command goes out as one line, "<seq> <COMMAND>\\n". The sketch answers
+"ACK <seq>" for a command it knows (before running it) or "NACK <seq>" for one
+it does not. Because each frame ends in a newline, Serial.readStringUntil('\\n')
+returns at once instead of waiting for the stream timeout.
+
+A reader thread parses every line the board sends into a typed event
+(AckEvent, LocationEvent for BLUE/PURPLE/YELLOW, LineEvent for anything else),
+keeps the last known location with its timestamp, and pushes each event to
+the subscribers. Nothing is flushed or polled, so no location line is lost.
+
+Measure the round trip against a connected board with:
+
+    python serial_link.py /dev/ttyACM0 --count 200
+"""
+
+import argparse
+import threading
+import time
+from collections import deque
+from typing import NamedTuple
+
+import serial
+
+from latency_trace import percentile
+
+LOCATIONS = ("BLUE", "PURPLE", "YELLOW")
+
+
+class AckEvent(NamedTuple):
+    seq: int
+    ok: bool  # False for NACK
+    timestamp: float  # time.monotonic() when the line was read
+
+
+class LocationEvent(NamedTuple):
+    location: str
+    timestamp: float
+
+
+class LineEvent(NamedTuple):
+    text: str
+    timestamp: float
+
+
+def parse_line(text, timestamp):
+    kind, _, seq = text.partition(' ')
+    if kind in ("ACK", "NACK") and seq.isdigit():
+        return AckEvent(int(seq), kind == "ACK", timestamp)
+    if text in LOCATIONS:
+        return LocationEvent(text, timestamp)
+    return LineEvent(text, timestamp)
+
+
+class SerialLink:
+    """Sends sequenced commands over a pyserial port; a reader thread handles everything coming back."""
+
+    def __init__(self, ser, ack_timeout=0.5, port=None, baudrate=115200):
+        self.ser = ser
+        self.ack_timeout = ack_timeout
+        self.port = port  # set when the link can reopen the port after an error
+        self.baudrate = baudrate
+        self.ser.timeout = 0.05  # reader wakes on the first byte, or at least this often
+
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._waiters = {}  # seq -> [threading.Event, AckEvent or None]
+        self._subscribers = []
+        self._running = False
+        self._thread = None
+
+        # Last known location, as reported by the board
+        self.location = None
+        self.location_time = None  # time.monotonic() of the last LocationEvent
+
+        self.sent = 0
+        self.acked = 0
+        self.nacked = 0
+        self.timeouts = 0
+        self.reconnects = 0
+        self.round_trips_ms = deque(maxlen=500)
+        self.round_trip_total_ms = 0.0  # over every ACK, for /metrics
+
+    @classmethod
+    def open(cls, port, baudrate=115200, ack_timeout=0.5):
+        """Open the port, reset the board the way the Pi scripts always have, and start reading."""
+        link = cls(cls._open_port(port, baudrate), ack_timeout=ack_timeout, port=port, baudrate=baudrate)
+        return link.start()
+
+    @staticmethod
+    def _open_port(port, baudrate):
+        ser = serial.Serial(port, baudrate, timeout=0.05)
+        try:
+            ser.setDTR(False)
+        except OSError:
+            return ser  # a pseudo-terminal (virtual_arduino.py) has no DTR line to reset
+        time.sleep(1)
+        ser.reset_input_buffer()
+        ser.setDTR(True)
+        time.sleep(2)
+        return ser
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._read_loop, name="SerialReader", daemon=True)
+            self._thread.start()
+        return self
+
+    def subscribe(self, callback):
+        """Call callback(event) for every event. Runs on the reader thread, so keep it short."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def send(self, command, wait_ack=True):
+        """Send one command. Returns the ACK round trip in ms, or None on NACK/timeout."""
+        if isinstance(command, bytes):
+            command = command.decode()
+        waiter = [threading.Event(), None]
+        with self._lock:
+            self._seq = self._seq % 65535 + 1
+            seq = self._seq
+            if wait_ack:
+                self._waiters[seq] = waiter
+
+        start = time.monotonic()
+        try:
+            self.ser.write(f"{seq} {command}\n".encode())
+            self.ser.flush()
+        except serial.SerialException as e:
+            print(f"Serial write error: {e}")
+            with self._lock:
+                self._waiters.pop(seq, None)
+            return None
+        self.sent += 1
+        if not wait_ack:
+            return None
+
+        acked = waiter[0].wait(self.ack_timeout)
+        with self._lock:
+            self._waiters.pop(seq, None)
+        if not acked:
+            self.timeouts += 1
+            print(f"WARNING: No ACK from Arduino for command: {command}")
+            return None
+        if not waiter[1].ok:
+            self.nacked += 1
+            print(f"WARNING: Arduino rejected command: {command}")
+            return None
+
+        round_trip_ms = max(0.0, (waiter[1].timestamp - start) * 1000)
+        self.acked += 1
+        self.round_trips_ms.append(round_trip_ms)
+        self.round_trip_total_ms += round_trip_ms
+        return round_trip_ms
+
+    def close(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        self.ser.close()
+
+    def _read_loop(self):
+        partial = b''
+        while self._running:
+            try:
+                data = self.ser.read(self.ser.in_waiting or 1)
+            except serial.SerialException as e:
+                print(f"Serial read error: {e}")
+                partial = b''
+                self._reconnect()
+                continue
+            if not data:
+                continue
+
+            partial += data
+            *lines, partial = partial.split(b'\n')
+            for line in lines:
+                text = line.decode(errors='replace').strip()
+                if text:
+                    self._dispatch(parse_line(text, time.monotonic()))
+
+    def _dispatch(self, event):
+        if isinstance(event, AckEvent):
+            with self._lock:
+                waiter = self._waiters.get(event.seq)
+            if waiter is not None:
+                waiter[1] = event
+                waiter[0].set()
+        elif isinstance(event, LocationEvent):
+            self.location = event.location
+            self.location_time = event.timestamp
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(event)
+
+    def _reconnect(self):
+        if self.port is None:
+            time.sleep(1)
+            return
+        try:
+            self.ser.close()
+        except serial.SerialException:
+            pass
+        while self._running:
+            time.sleep(1)
+            try:
+                self.ser = self._open_port(self.port, self.baudrate)
+                self.reconnects += 1
+                print(f"Serial port {self.port} reopened")
+                return
+            except serial.SerialException as e:
+                print(f"Serial reconnect failed: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('port', help='Serial port of the Arduino.')
+    parser.add_argument('--count', type=int, default=100, help='Number of PING round trips.')
+    args = parser.parse_args()
+
+    link = SerialLink.open(args.port)
+    for _ in range(args.count):
+        link.send(b'PING')
+    link.close()
+
+    round_trips = sorted(link.round_trips_ms)
+    if not round_trips:
+        print("No ACKs received")
+        return
+    print(f"{len(round_trips)}/{args.count} acked, "
+          f"p50 {percentile(round_trips, 0.5):.2f} ms, "
+          f"p95 {percentile(round_trips, 0.95):.2f} ms, "
+          f"max {round_trips[-1]:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""NDJSON trace of what the live pipeline sees and does, written on a background thread.
+
+One JSON object per line, each with "k" (kind) and "t" (time.monotonic()):
+
+    header   version, wall clock start
+    frame    ts (inference timestamp_ms), seq, capture (capture time)
+    face     ts, detections: [[x, y, w, h, score], ...] in inference-frame pixels
+    gesture  ts, hands: [[category, score, handedness], ...]
+    serial   line received from the board (locations, CHECK_LOCATION replies, other text)
+    ack      seq, ok
+    command  cmd sent to the board
+
+record() only puts a tuple on a queue; JSON encoding and file I/O happen on
+the writer thread. Paths ending in .gz are gzip-compressed. Replay a trace
+with replay_trace.py.
+"""
+
+import atexit
+import gzip
+import json
+import queue
+import threading
+import time
+
+from interaction_fsm import Gesture, Location, PeopleCount
+
+VERSION = 1
+
+
+def face_detections(result):
+    """Plain-data copy of a FaceDetectorResult."""
+    detections = []
+    for detection in result.detections:
+        bbox = detection.bounding_box
+        score = round(detection.categories[0].score, 3) if detection.categories else None
+        detections.append([bbox.origin_x, bbox.origin_y, bbox.width, bbox.height, score])
+    return detections
+
+
+def hand_gestures(result):
+    """Plain-data copy of a GestureRecognizerResult: top category per hand."""
+    return [[gestures[0].category_name, round(gestures[0].score, 3), handedness[0].category_name]
+            for gestures, handedness in zip(result.gestures, result.handedness) if gestures]
+
+
+def event_from_record(record, confirmer, people=None):
+    """The interaction event a live callback would have posted for this record, or None.
+
+    `confirmer` is the GestureConfirmer every gesture record goes through, in
+    order; `people`, if given, the PeopleCountConfirmer every face record does.
+    """
+    kind = record["k"]
+    if kind == "face":
+        count = len(record["detections"])
+        if people is not None:
+            count = people.update(record["t"], count)
+        return PeopleCount(count, record["t"]) if count is not None else None
+    if kind == "gesture":
+        confirmed = confirmer.update(record["t"], record["hands"])
+        return Gesture(confirmed, record["t"]) if confirmed else None
+    if kind == "serial" and record["line"] in ("BLUE", "PURPLE", "YELLOW"):
+        return Location(record["line"], record["t"])
+    return None
+
+
+def open_trace(path, mode='rt'):
+    return gzip.open(path, mode) if path.endswith('.gz') else open(path, mode.replace('t', ''))
+
+
+def read_trace(path):
+    """Records in file order. A tail cut off by power loss or SIGKILL (no gzip
+    trailer, half-written last line) ends the trace instead of failing it."""
+    with open_trace(path) as f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    print(f"WARNING: {path} ends in a partial record; skipped it")
+                    return
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile) as e:
+            print(f"WARNING: {path} is truncated ({e}); read up to the cut")
+
+
+class TraceRecorder:
+    """Appends records to an NDJSON trace from a writer thread.
+
+    record(kind, t=None, **fields) is safe from any thread and costs a tuple
+    and a queue put; `t` defaults to time.monotonic(). close() also runs at
+    interpreter exit, so the gzip trailer is written however the app stops
+    short of SIGKILL (SIGTERM has to be turned into an exit, see
+    piarduino_merge.py).
+    """
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._file = open_trace(path, 'wt')
+        self._thread = threading.Thread(target=self._write_loop, name="TraceWriter", daemon=True)
+        self.records_written = 0
+        self.bytes_written = 0
+        self._closed = False
+        self.record("header", version=VERSION, wall=time.time())
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, kind, t=None, **fields):
+        self._queue.put((kind, time.monotonic() if t is None else t, fields))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._file.close()
+
+    def _write_loop(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                kind, t, fields = item
+                line = json.dumps({"k": kind, "t": round(t, 6), **fields}, separators=(',', ':')) + "\n"
+                self._file.write(line)
+                self.records_written += 1
+                self.bytes_written += len(line)
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._file.flush()
+                last_flush = time.monotonic()
+        self._file.flush()
@@ -0,0 +1,353 @@
+"""Runs the interaction FSM on a virtual clock, far faster than real time.
+
+No camera, models or serial port: face counts, gestures and RFID locations
+are synthetic events, timers fire as soon as the simulation reaches their
+deadline, and commands are recorded with the time the dispatcher would have
+sent them. A randomized user sits down, starts studying, follows (or ignores)
+the nudges and leaves again; thousands of such scenarios run in parallel:
+
+    python simulate_session.py --scenarios 2000 --hours 2 --workers 4
+    python simulate_session.py --seed 7 --hours 0.5 --timeline
+    python simulate_session.py --scenarios 500 --dropReplies 0.2   # the board misses CHECK_LOCATIONs
+    python simulate_session.py --droppedReply                      # one lost or garbled reply, checked step by step
+"""
+
+import argparse
+import contextlib
+import heapq
+import io
+import itertools
+import json
+import multiprocessing
+import random
+import time
+from collections import Counter
+
+import interaction_fsm
+from interaction_fsm import Gesture, InteractionFSM, Location, LocationReply, PeopleCount
+from timer_wheel import TimerWheel
+
+# Commands that only make sense during a study session
+STUDY_COMMANDS = {"BREAK_PURPLE", "BREAK_YELLOW", "SECOND_BREAK_NUDGE", "BACK_TO_STUDY",
+                  "SECOND_STUDY_NUDGE", "STUDY_RESTART", "EXTEND_STUDY", "EXTEND_BREAK"}
+STUDY_STARTS = {"STUDY", "EXTEND_STUDY", "STUDY_RESTART"}
+
+
+class VirtualClock:
+    """Drop-in for time.monotonic that only moves when the simulation says so."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance_to(self, t):
+        self.now = max(self.now, t)
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class Simulation:
+    """Feeds scheduled events to an InteractionFSM and records what it sends.
+
+    at(t, event) delivers a PeopleCount/Gesture/Location event at simulated
+    time t (its timestamp is replaced by t); at(t, fn) calls fn() instead,
+    which is how reactive users are written. send/request_location behave
+    like piarduino_merge's: repeats are skipped, holds delay later commands,
+    and CHECK_LOCATION is answered with the current location. A fraction
+    `drop_replies` of them (and the next `drop_next_replies`) go unanswered
+    and time out after `reply_timeout`, like the dispatcher's; set
+    `dropped_reply` to a stray line (e.g. a NACK) to have that passed on
+    as the reply instead of None.
+    """
+
+    def __init__(self, location="BLUE", seed=0, reply_latency=0.02, drop_replies=0.0, reply_timeout=1.0):
+        self.clock = VirtualClock()
+        self.random = random.Random(seed)
+        self.timers = TimerWheel(clock=self.clock)
+        self.fsm = InteractionFSM(self._send, self._request_location,
+                                  timers=self.timers, choose=self.random.choice)
+        self.location = location
+        self.reply_latency = reply_latency
+        self.drop_replies = drop_replies
+        self.drop_next_replies = 0
+        self.dropped_reply = None
+        self.reply_timeout = reply_timeout
+        self.replies_dropped = 0
+        self.on_command = None  # callback(command, t) for reactive users
+
+        self.commands = []  # (time decided, command, time the dispatcher sends it after holds)
+        self.events = 0
+        self._inputs = []  # heap of (t, order, event or callable)
+        self._order = itertools.count()
+        self._previous_command = None
+        self._hold_until = 0.0
+        if location is not None:
+            # The board reads the card it is standing on when it powers up
+            self.at(0.0, Location(location, 0.0))
+
+    def at(self, t, item):
+        heapq.heappush(self._inputs, (t, next(self._order), item))
+
+    def move_to(self, location):
+        """The robot is put down on an RFID card (the board reports each new card once)."""
+        if location != self.location:
+            self.location = location
+            self.fsm.handle(Location(location, self.clock.now))
+            self.events += 1
+
+    def run(self, until):
+        if self.fsm.state is None:
+            self.fsm.start(self.clock.now)
+        while True:
+            next_input = self._inputs[0][0] if self._inputs else float('inf')
+            deadline = self.timers.next_deadline()
+            t = min(next_input, deadline if deadline is not None else float('inf'))
+            if t > until:
+                break
+            self.clock.advance_to(t)
+            self.timers.advance(t)
+            while self._inputs and self._inputs[0][0] <= t:
+                _, _, item = heapq.heappop(self._inputs)
+                if callable(item):
+                    item()
+                else:
+                    self.fsm.handle(item._replace(timestamp=t))
+                    self.events += 1
+        self.clock.advance_to(until)
+        self.timers.advance(until)
+        return self
+
+    def _record(self, command, hold=0.0):
+        sent_at = max(self.clock.now, self._hold_until)
+        if hold:
+            self._hold_until = sent_at + hold
+        self.commands.append((round(self.clock.now, 3), command.decode(), round(sent_at, 3)))
+
+    def _send(self, command, hold=0.0, repeat=False, frame_ms=None):
+        if not repeat:
+            if command == self._previous_command:
+                return
+            self._previous_command = command
+        self._record(command, hold)
+        if self.on_command is not None:
+            self.on_command(command.decode(), self.clock.now)
+
+    def _request_location(self, purpose):
+        if self._previous_command == b'CHECK_LOCATION':
+            return
+        self._previous_command = b'CHECK_LOCATION'
+        self._record(b'CHECK_LOCATION')
+        if self.drop_next_replies or (self.drop_replies and self.random.random() < self.drop_replies):
+            self.drop_next_replies = max(0, self.drop_next_replies - 1)
+            self.replies_dropped += 1
+            reply = self.dropped_reply
+            self.at(self.clock.now + self.reply_timeout, lambda: self._location_reply(purpose, reply))
+        else:
+            # Location is read when the reply is due, as the board answers with its current card
+            self.at(self.clock.now + self.reply_latency, lambda: self._location_reply(purpose, self.location))
+
+    def _location_reply(self, purpose, location):
+        # Answered or timed out: the next CHECK_LOCATION goes out again (see piarduino_merge.on_location_reply)
+        if self._previous_command == b'CHECK_LOCATION':
+            self._previous_command = None
+        self.fsm.handle(LocationReply(purpose, location, self.clock.now))
+
+
+class RandomUser:
+    """A synthetic student driven by the robot's commands.
+
+    Sits down, closes a fist to start studying, mostly follows the break and
+    back-to-study nudges (sometimes late, sometimes extending instead), quits
+    with a thumbs-up after a few cycles, leaves and comes back later. Crowds,
+    waves and flickering face counts are thrown in as noise.
+    """
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.rng = sim.random
+        self.present = False
+        self.cycles_left = 0
+        sim.on_command = self.on_command
+
+    def start(self, t):
+        self.sim.at(t, self.arrive)
+        for _ in range(self.rng.randint(0, 6)):
+            self.sim.at(self.rng.uniform(t, t + 3600), self.crowd)
+
+    def gesture(self, name, t):
+        # A held gesture, as the GestureConfirmer reports it a few frames in
+        self.sim.at(t + self.rng.uniform(0.2, 0.5), Gesture(name, 0.0))
+
+    def arrive(self):
+        now = self.sim.clock.now
+        self.present = True
+        self.cycles_left = self.rng.randint(1, 5)
+        self.sim.at(now, PeopleCount(1, 0.0))
+        if self.rng.random() < 0.3:
+            self.gesture("Open_Palm", now + self.rng.uniform(0.5, 3))
+        self.gesture("Closed_Fist", now + self.rng.uniform(2, 20))
+
+    def leave(self):
+        now = self.sim.clock.now
+        self.present = False
+        self.sim.at(now, PeopleCount(0, 0.0))
+        self.sim.at(now + self.rng.uniform(60, 900), self.arrive)
+
+    def crowd(self):
+        if self.present:
+            now = self.sim.clock.now
+            self.sim.at(now, PeopleCount(3, 0.0))
+            self.sim.at(now + self.rng.uniform(1, 10), PeopleCount(1, 0.0))
+
+    def on_command(self, command, now):
+        rng = self.rng
+        if not self.present:
+            return
+        if command == "MOVE_TO_DESK":
+            later = now + rng.uniform(3, 15)
+            self.sim.at(later, lambda: self.sim.move_to("BLUE"))
+            self.gesture("Closed_Fist", later + 2)
+        elif command.startswith("BREAK_"):
+            spot = command.split("_")[1]
+            roll = rng.random()
+            if roll < 0.75:
+                self.sim.at(now + rng.uniform(3, 50), lambda: self.sim.move_to(spot))
+            elif roll < 0.85:
+                self.gesture("Closed_Fist", now + rng.uniform(1, 20))  # keep studying
+        elif command == "BACK_TO_STUDY":
+            roll = rng.random()
+            if roll < 0.85:
+                self.sim.at(now + rng.uniform(2, 30), lambda: self.sim.move_to("BLUE"))
+            else:
+                self.gesture("Closed_Fist", now + rng.uniform(1, 10))  # longer break
+        elif command == "STUDY_RESTART":
+            self.cycles_left -= 1
+            if self.cycles_left <= 0:
+                done = now + rng.uniform(5, 60)
+                self.gesture("Thumb_Up", done)
+                self.sim.at(done + rng.uniform(8, 30), self.leave)
+
+
+def check_commands(commands):
+    """Sanity checks on a command log; returns a list of problems found."""
+    problems = []
+    studying = False
+    study_start = None
+    for t, command, _ in commands:
+        if command in ("STUDY", "EXTEND_STUDY", "STUDY_RESTART", "EXTEND_BREAK"):
+            studying = True
+        if command == "STANDBY":
+            studying = False
+        elif command in STUDY_COMMANDS and not studying:
+            problems.append(f"{command} at {t} outside a study session")
+        if command in STUDY_STARTS:
+            study_start = t
+        elif command.startswith("BREAK_") and study_start is not None:
+            if t - study_start < interaction_fsm.FIRST_BREAK_NUDGE - 0.001:
+                problems.append(f"{command} at {t} only {t - study_start:.3f} s into the session")
+    return problems
+
+
+def dropped_reply_scenario(reply=None):
+    """The CHECK_LOCATION of the second break nudge goes unanswered once; it must be asked again.
+
+    The user sits at the desk, starts studying and ignores the first nudge,
+    so the retried check finds the robot still on BLUE and the sound nudge
+    follows. `reply` is what the lost request gets back: None for a timeout,
+    or a stray line that is not a location. Returns the command log and the
+    problems found.
+    """
+    sim = Simulation(location="BLUE")
+    sim.drop_next_replies = 1
+    sim.dropped_reply = reply
+    start = 5.0
+    sim.at(start, PeopleCount(1, 0.0))
+    sim.at(start + 1, Gesture("Closed_Fist", 0.0))
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(start + 1 + interaction_fsm.SECOND_BREAK_NUDGE + 10)
+    commands = [command for _, command, _ in sim.commands]
+    problems = check_commands(sim.commands)
+    if commands.count("CHECK_LOCATION") < 2:
+        problems.append("unanswered CHECK_LOCATION was never retried")
+    if "SECOND_BREAK_NUDGE" not in commands:
+        problems.append(f"no SECOND_BREAK_NUDGE after the retry (state {sim.fsm.state})")
+    return {"reply": reply, "commands": sim.commands, "replies_dropped": sim.replies_dropped,
+            "final_state": sim.fsm.state, "problems": problems}
+
+
+def run_scenario(args):
+    seed, hours, timeline, drop_replies = args
+    rng = random.Random(seed)
+    sim = Simulation(location=rng.choice(("BLUE", "BLUE", "BLUE", "PURPLE", "YELLOW")), seed=seed,
+                     drop_replies=drop_replies)
+    RandomUser(sim).start(rng.uniform(0, 60))
+    with contextlib.redirect_stdout(io.StringIO()):  # the FSM's console chatter
+        sim.run(hours * 3600)
+    result = {
+        "seed": seed,
+        "events": sim.events,
+        "timers_fired": sim.timers.fired,
+        "replies_dropped": sim.replies_dropped,
+        "final_state": sim.fsm.state,
+        "counts": dict(Counter(command for _, command, _ in sim.commands)),
+        "problems": check_commands(sim.commands),
+    }
+    if timeline:
+        result["commands"] = sim.commands
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--scenarios', type=int, default=1, help='Number of randomized scenarios.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the first scenario.')
+    parser.add_argument('--hours', type=float, default=1.0, help='Simulated time per scenario.')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='Worker processes.')
+    parser.add_argument('--timeline', action='store_true', help='Include every command and its time.')
+    parser.add_argument('--dropReplies', type=float, default=0.0,
+                        help='Fraction of CHECK_LOCATION requests the board never answers.')
+    parser.add_argument('--droppedReply', action='store_true',
+                        help='Run the dropped-reply scenarios (timeout, NACK line) instead and exit non-zero on problems.')
+    parser.add_argument('--out', default=None, help='Write the full JSON report here.')
+    args = parser.parse_args()
+
+    if args.droppedReply:
+        results = [dropped_reply_scenario(reply) for reply in (None, "NACK 3")]
+        print(json.dumps(results, indent=2))
+        raise SystemExit(1 if any(result["problems"] for result in results) else 0)
+
+    jobs = [(seed, args.hours, args.timeline, args.dropReplies) for seed in range(args.seed, args.seed + args.scenarios)]
+    start = time.perf_counter()
+    if args.workers > 1 and len(jobs) > 1:
+        with multiprocessing.Pool(args.workers) as pool:
+            results = pool.map(run_scenario, jobs, chunksize=max(1, len(jobs) // (args.workers * 8)))
+    else:
+        results = [run_scenario(job) for job in jobs]
+    wall = time.perf_counter() - start
+
+    totals = Counter()
+    for result in results:
+        totals.update(result["counts"])
+    simulated = args.hours * 3600 * len(results)
+    summary = {
+        "scenarios": len(results),
+        "simulated_hours": round(simulated / 3600, 1),
+        "wall_seconds": round(wall, 3),
+        "speedup": round(simulated / wall),
+        "events": sum(result["events"] for result in results),
+        "commands": dict(totals.most_common()),
+        "scenarios_with_problems": [result["seed"] for result in results if result["problems"]],
+    }
+    report = {"summary": summary, "scenarios": results}
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=1)
+    print(json.dumps(report if len(results) == 1 else summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,35 @@
-from picamera2 import Picamera2
-from flask import Flask, Response
-import io
-import cv2
+import os
+import threading
+import time
+
+from frame_broadcast import FrameBroadcaster
+from stream_server import StreamServer
+
+# NOMO_CAMERA=synthetic (or a video file) runs without the Pi camera, see synthetic_camera.py
+if os.environ.get("NOMO_CAMERA"):
+    from synthetic_camera import SyntheticCamera as Picamera2
+else:
+    from picamera2 import Picamera2
 
-app = Flask(__name__)
 picam2 = Picamera2()
 picam2.configure(picam2.create_video_configuration(main={"size": (1280, 720), "format": "RGB888"}))
 picam2.start()
 
-def generate_frames():
+# One capture loop for all viewers; each frame is encoded once per quality tier in use
+broadcaster = FrameBroadcaster()
+
+def capture_frames():
     while True:
         frame = picam2.capture_array()
-        _, buffer = cv2.imencode('.jpg', frame)
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+        if broadcaster.wanted:
+            broadcaster.publish_frame(frame, time.time())
+
+threading.Thread(target=capture_frames, name="Capture", daemon=True).start()
 
-@app.route('/video_feed')
-def video_feed():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+# Every viewer and snapshot request is served from one asyncio thread
+server = StreamServer(broadcaster, port=5000)
+server.add_stream('/video_feed')
+server.add_snapshot('/snapshot.jpg')
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, threaded=True)
+    server.run()
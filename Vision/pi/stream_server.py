@@ -0,0 +1,329 @@
+"""Event-loop HTTP front end for the Pi apps: MJPEG streams, snapshots, detection events, state and /metrics.
+
+One asyncio thread serves every connection, where Flask's development
+server spent a thread per viewer. Viewers share FrameBroadcaster's tiers
+exactly like the threaded path (frame_broadcast.Viewer); a snapshot
+returns the JPEG viewers were already sent, or has the pipeline encode
+one frame when nobody is streaming; JSON routes answer in a few hundred
+bytes for dashboards that only poll state; server-sent events push each
+frame's detections (EventFeed) so viewer.html draws the overlays in the
+browser instead of the Pi.
+
+    server = StreamServer(broadcaster, port=5000)
+    server.add_stream("/nomo")
+    server.add_snapshot("/nomo/snapshot.jpg")
+    server.add_json("/nomo/state", current_state)
+    server.add_events("/nomo/events", detections)
+    server.run()
+
+Only GET and HEAD are served, without request bodies; that is all the
+viewers, dashboards and Prometheus need.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from typing import NamedTuple
+
+from frame_broadcast import TRAILER, Viewer, limit_send_buffer, unsent_bytes
+
+STREAM_CONTENT_TYPE = "multipart/x-mixed-replace; boundary=frame"
+EVENTS_CONTENT_TYPE = "text/event-stream"
+MAX_HEADER_BYTES = 16 * 1024
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           503: "Service Unavailable"}
+
+
+class HTTPResponse(NamedTuple):
+    status: int
+    content_type: str
+    body: bytes
+    headers: tuple = ()  # extra (name, value) pairs
+
+
+def _text(status, message):
+    return HTTPResponse(status, "text/plain; charset=utf-8", message.encode() + b"\n")
+
+
+def _head(status, content_type, content_length=None, headers=(), keep_alive=True):
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Type: {content_type}",
+             "Cache-Control: no-store"]
+    if content_length is not None:
+        lines.append(f"Content-Length: {content_length}")
+    lines.extend(f"{name}: {value}" for name, value in headers)
+    lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+class EventFeed:
+    """Newest JSON record for server-sent-event subscribers; publish() may be called from any thread.
+
+    Like the frame fan-out, a subscriber that falls behind gets the newest
+    record rather than a backlog. Records carry the frame id they describe,
+    so a viewer keeps the last few and picks the one for the frame it shows.
+    """
+
+    def __init__(self, event="message"):
+        self.event = event
+        self._lock = threading.Lock()
+        self._latest = None  # (seq, encoded SSE message)
+        self._seq = 0
+        self._listeners = []
+        self.subscribers = 0  # changed on the server's loop only
+        self.bytes_published = 0
+
+    @property
+    def wanted(self):
+        """Whether anyone is listening; skip building records when not."""
+        return self.subscribers > 0
+
+    def publish(self, record, id=None):
+        """Encode `record` once for every subscriber; `id` becomes the SSE event id."""
+        message = ("" if id is None else f"id: {id}\n") + \
+            f"event: {self.event}\ndata: {json.dumps(record, separators=(',', ':'))}\n\n"
+        message = message.encode()
+        with self._lock:
+            self._seq += 1
+            self._latest = (self._seq, message)
+            seq = self._seq
+        self.bytes_published += len(message)
+        for listener in list(self._listeners):
+            listener(seq)
+
+    def latest(self, after=0):
+        """(seq, message) of the newest record if it is newer than `after`, else None."""
+        with self._lock:
+            latest = self._latest
+        return latest if latest is not None and latest[0] > after else None
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self._listeners.remove(callback)
+
+
+class StreamServer:
+    """HTTP/1.1 server on one asyncio loop; routes are added before run() or start()."""
+
+    def __init__(self, broadcaster, host="0.0.0.0", port=5000, snapshot_max_age=1.0,
+                 snapshot_timeout=2.0, send_buffer=64 * 1024):
+        self.broadcaster = broadcaster
+        self.host = host
+        self.port = port
+        self.snapshot_max_age = snapshot_max_age  # seconds a cached snapshot is served for
+        self.snapshot_timeout = snapshot_timeout  # seconds to wait for the pipeline to encode one
+        self.send_buffer = send_buffer
+        # path -> async handler(method, writer) returning an HTTPResponse, or None once it has streamed
+        self.routes = {}
+        self.requests = 0
+        self.snapshots_cached = 0  # snapshot requests answered from an already encoded frame
+        self.snapshots_encoded = 0  # snapshot requests that had a frame encoded for them
+        self._loop = None
+        self._feeds = []
+        self._update = None  # asyncio.Event set on the next published frame or record, then replaced
+
+    # --- routes ---
+
+    def add_stream(self, path):
+        """MJPEG stream of the broadcaster's frames."""
+        self.routes[path] = self._stream
+
+    def add_snapshot(self, path):
+        """Newest frame as a single JPEG."""
+        self.routes[path] = self._snapshot
+
+    def add_json(self, path, build):
+        """`build()` returns a JSON-serialisable object; called on the loop, so it must be quick."""
+        async def handler(method, writer):
+            return HTTPResponse(200, "application/json", json.dumps(build(), separators=(",", ":")).encode())
+        self.routes[path] = handler
+
+    def add_text(self, path, build, content_type="text/plain; charset=utf-8"):
+        """`build()` returns the body as str (e.g. metrics.MetricsPage.render())."""
+        async def handler(method, writer):
+            return HTTPResponse(200, content_type, build().encode())
+        self.routes[path] = handler
+
+    def add_events(self, path, feed):
+        """Server-sent events: each record published to `feed`, newest first when a client lags."""
+        self._feeds.append(feed)
+
+        async def handler(method, writer):
+            return await self._events(feed, method, writer)
+        self.routes[path] = handler
+
+    def add_static(self, path, body, content_type="text/html; charset=utf-8"):
+        """A fixed page, e.g. viewer.html."""
+        response = HTTPResponse(200, content_type, body if isinstance(body, bytes) else body.encode())
+
+        async def handler(method, writer):
+            return response
+        self.routes[path] = handler
+
+    # --- serving ---
+
+    def run(self):
+        """Serve forever on the calling thread."""
+        asyncio.run(self._serve())
+
+    def start(self):
+        """Serve on a daemon thread."""
+        threading.Thread(target=self.run, name="StreamServer", daemon=True).start()
+        return self
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._update = asyncio.Event()
+        self.broadcaster.add_listener(self._on_publish)
+        for feed in self._feeds:
+            feed.add_listener(self._on_publish)
+        try:
+            server = await asyncio.start_server(self._connection, self.host, self.port,
+                                                limit=MAX_HEADER_BYTES)
+            print(f"Serving on http://{self.host}:{self.port} ({', '.join(sorted(self.routes))})")
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.broadcaster.remove_listener(self._on_publish)
+            for feed in self._feeds:
+                feed.remove_listener(self._on_publish)
+
+    def _on_publish(self, seq):
+        # Runs on the publishing thread: hand the wake-up to the loop and return at once
+        self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        update, self._update = self._update, asyncio.Event()
+        update.set()
+
+    async def _next_update(self, timeout):
+        """Wait for the next published frame or record; False on timeout."""
+        try:
+            await asyncio.wait_for(self._update.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                self.requests += 1
+                lines = head.decode("latin-1").split("\r\n")
+                request_line = lines[0].split()
+                if len(request_line) != 3:
+                    self._respond(writer, _text(400, "Bad request"), "GET", keep_alive=False)
+                    break
+                method, target, version = request_line
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+                handler = self.routes.get(target.split("?", 1)[0])
+                if handler is None:
+                    response = _text(404, "Not found")
+                elif method not in ("GET", "HEAD"):
+                    response, keep_alive = _text(405, "Only GET and HEAD are supported"), False
+                else:
+                    response = await handler(method, writer)
+                    if response is None:
+                        break  # streamed until the viewer went away
+                self._respond(writer, response, method, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _respond(writer, response, method, keep_alive=True):
+        writer.write(_head(response.status, response.content_type, len(response.body), response.headers,
+                           keep_alive))
+        if method != "HEAD":
+            writer.write(response.body)  # not joined to the head: snapshots are the shared JPEG bytes
+
+    # --- handlers ---
+
+    async def _snapshot(self, method, writer):
+        snapshot = self.broadcaster.snapshot(self.snapshot_max_age)
+        if snapshot is not None:
+            self.snapshots_cached += 1
+        else:
+            # Nothing recent enough: have the pipeline encode its next frame (shared by every waiting request)
+            self.broadcaster.request_frame()
+            deadline = time.monotonic() + self.snapshot_timeout
+            while snapshot is None and time.monotonic() < deadline:
+                if await self._next_update(deadline - time.monotonic()):
+                    snapshot = self.broadcaster.snapshot(self.snapshot_max_age)
+            if snapshot is None:
+                return _text(503, "No frame available")
+            self.snapshots_encoded += 1
+        jpeg, timestamp = snapshot
+        return HTTPResponse(200, "image/jpeg", jpeg, (("X-Timestamp", f"{timestamp:.6f}"),))
+
+    async def _stream(self, method, writer):
+        if method == "HEAD":
+            return HTTPResponse(200, STREAM_CONTENT_TYPE, b"")
+        sock = writer.get_extra_info("socket")
+        limit_send_buffer(sock, self.send_buffer)
+        # drain() then returns only once everything is handed to the kernel, like a blocking sendall()
+        writer.transport.set_write_buffer_limits(high=0)
+        writer.write(_head(200, STREAM_CONTENT_TYPE, keep_alive=False))
+        viewer = Viewer(self.broadcaster)
+        try:
+            await writer.drain()
+            while not writer.is_closing():
+                latest = self.broadcaster.wait(viewer.last_seq, 0)
+                if latest is None:
+                    await self._next_update(5.0)
+                    continue
+                part = viewer.pick(latest, unsent_bytes(sock))
+                if part is None:
+                    continue
+                header, jpeg = part
+                written = time.monotonic()
+                # Separate writes, no join: the JPEG bytes are shared with every viewer on the tier
+                writer.write(header)
+                writer.write(jpeg)
+                writer.write(TRAILER)
+                await writer.drain()
+                viewer.written(time.monotonic() - written)
+        except ConnectionError:
+            pass
+        finally:
+            viewer.close()
+        return None
+
+    async def _events(self, feed, method, writer):
+        if method == "HEAD":
+            return HTTPResponse(200, EVENTS_CONTENT_TYPE, b"")
+        writer.write(_head(200, EVENTS_CONTENT_TYPE, keep_alive=False))
+        feed.subscribers += 1
+        try:
+            last_seq = 0
+            while not writer.is_closing():
+                latest = feed.latest(last_seq)
+                if latest is None:
+                    if not await self._next_update(15.0):
+                        writer.write(b": idle\n\n")  # comment line: keeps proxies from closing a quiet stream
+                        await writer.drain()
+                    continue
+                last_seq, message = latest
+                writer.write(message)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            feed.subscribers -= 1
+        return None
@@ -0,0 +1,162 @@
+"""Stand-in for Picamera2 that plays a video file or synthetic frames at the camera's frame rate.
+
+Implements the part of the Picamera2 API the Pi apps use (video
+configuration with main/lores streams, start/stop, capture_request with
+SensorTimestamp metadata, capture_array), so piarduino_merge.py and
+stream2.py run on any Linux box:
+
+    NOMO_CAMERA=synthetic NOMO_SERIAL_PORT=/dev/pts/5 python piarduino_merge.py
+    NOMO_CAMERA=session.mp4 python stream2.py
+
+Frames are prepared once up front and cycled, so producing one costs a copy
+like the real camera's DMA buffer does rather than any drawing or decoding.
+A recording with people in view makes the detectors do real work;
+synthetic frames only exercise capture, conversion and streaming.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+
+def parse_size(text):
+    """"1280x720" -> (1280, 720), for the benchmarks' --size options."""
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def synthetic_frames(size, count, seed=0):
+    """Noise background with a few moving blobs (BGR), so trackers see motion between frames."""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (0, 0), 5)
+    blobs = [(rng.uniform(0, width), rng.uniform(0, height), rng.uniform(-8, 8), rng.uniform(-8, 8),
+              tuple(int(c) for c in rng.integers(0, 256, 3))) for _ in range(4)]
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        for x, y, dx, dy, colour in blobs:
+            centre = (int((x + dx * i) % width), int((y + dy * i) % height))
+            cv2.circle(frame, centre, max(8, height // 10), colour, -1)
+        frames.append(frame)
+    return frames
+
+
+def video_frames(path, size, count):
+    """Up to `count` frames of a recording, resized to `size` (BGR)."""
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(cv2.resize(frame, size, interpolation=cv2.INTER_AREA))
+    cap.release()
+    if not frames:
+        raise ValueError(f"Unable to read frames from {path}")
+    return frames
+
+
+def _convert(frame, stream_config):
+    """A BGR frame in the layout Picamera2 gives for the stream's format."""
+    frame = cv2.resize(frame, tuple(stream_config["size"]), interpolation=cv2.INTER_AREA)
+    fmt = stream_config["format"]
+    if fmt == "YUV420":
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+    if fmt == "BGR888":  # libcamera's BGR888 is RGB byte order
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    if fmt in ("XRGB8888", "XBGR8888"):
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+    return frame  # RGB888 is BGR byte order
+
+
+class SyntheticRequest:
+    """What capture_request() returns: the frame's arrays and metadata until release()."""
+
+    def __init__(self, arrays, metadata):
+        self._arrays = arrays
+        self._metadata = metadata
+
+    def get_metadata(self):
+        return self._metadata
+
+    @contextmanager
+    def mapped_array(self, stream):
+        """Same shape as picamera2.MappedArray(request, stream): an object with .array."""
+        yield SimpleNamespace(array=self._arrays[stream])
+
+    def make_array(self, stream):
+        return self._arrays[stream].copy()
+
+    def release(self):
+        self._arrays = None
+
+
+class SyntheticCamera:
+    """Picamera2-like camera producing frames at `fps` from `source` ("synthetic" or a video path)."""
+
+    def __init__(self, source=None, fps=30.0, frames=90):
+        self.source = source or os.environ.get("NOMO_CAMERA", "synthetic")
+        self.fps = fps
+        self.frame_count = frames
+        self._config = None
+        self._frames = None  # stream -> list of arrays
+        self._index = 0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+        self._started = False
+
+    def create_video_configuration(self, main=None, lores=None, **unused):
+        main = {"size": (640, 480), "format": "XBGR8888", **(main or {})}
+        config = {"main": main, "lores": None}
+        if lores:
+            config["lores"] = {"format": "YUV420", **lores}
+        return config
+
+    def configure(self, config):
+        self._config = config
+
+    def camera_configuration(self):
+        return self._config
+
+    def start(self):
+        if self._config is None:
+            self.configure(self.create_video_configuration())
+        size = tuple(self._config["main"]["size"])
+        frames = synthetic_frames(size, self.frame_count) if self.source == "synthetic" \
+            else video_frames(self.source, size, self.frame_count)
+        self._frames = {
+            stream: [_convert(frame, self._config[stream]) for frame in frames]
+            for stream in ("main", "lores") if self._config.get(stream)
+        }
+        self._next_time = time.monotonic()
+        self._started = True
+
+    def stop(self):
+        self._started = False
+
+    def capture_request(self):
+        """Blocks until the next frame is due, like the real camera's frame pacing."""
+        with self._lock:
+            if not self._started:
+                raise RuntimeError("Camera is not started")
+            now = time.monotonic()
+            if self._next_time > now:
+                time.sleep(self._next_time - now)
+            exposure_ns = time.clock_gettime_ns(time.CLOCK_BOOTTIME)
+            self._next_time = max(self._next_time + 1 / self.fps, time.monotonic() - 1 / self.fps)
+            arrays = {stream: frames[self._index % len(frames)] for stream, frames in self._frames.items()}
+            self._index += 1
+        return SyntheticRequest(arrays, {"SensorTimestamp": exposure_ns})
+
+    def capture_array(self, name="main"):
+        request = self.capture_request()
+        try:
+            return request.make_array(name)
+        finally:
+            request.release()
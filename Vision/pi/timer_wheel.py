@@ -0,0 +1,123 @@
+"""Hashed timer wheel for the robot's cancellable timers (nudges, alone timer, look, wave cooldown)."""
+
+import time
+
+
+class Timer:
+    """A scheduled callback; cancel() is O(1), the wheel drops it when its slot comes round."""
+
+    __slots__ = ("deadline", "tick", "callback", "active", "_wheel")
+
+    def __init__(self, wheel, deadline, tick, callback):
+        self._wheel = wheel
+        self.deadline = deadline
+        self.tick = tick
+        self.callback = callback
+        self.active = True
+
+    def cancel(self):
+        if self.active:
+            self.active = False
+            self._wheel.pending -= 1
+
+
+class TimerWheel:
+    """Timers hashed into `slots` buckets of `resolution` seconds.
+
+    schedule() and cancel() are O(1). advance(now) fires every timer whose
+    deadline has passed and only looks at the buckets between the previous
+    call and `now`, so its cost does not grow with the number of timers
+    pending further out. Timers fire at their exact deadline, not at the
+    bucket boundary, as long as advance() is called at next_deadline().
+    Not thread-safe: schedule, cancel and advance from one thread.
+    """
+
+    def __init__(self, resolution=0.01, slots=1024, clock=time.monotonic):
+        self.resolution = resolution
+        self.clock = clock
+        self._slots = [[] for _ in range(slots)]
+        self._tick = self._to_tick(clock())  # buckets before this one have been processed
+        self.pending = 0
+        self.fired = 0
+        self._next = None  # cached next_deadline(), None when it has to be looked up again
+
+    def _to_tick(self, t):
+        return int(t / self.resolution)
+
+    def schedule(self, delay, callback, now=None):
+        """Call callback() `delay` seconds after `now` (default: the wheel's clock)."""
+        if now is None:
+            now = self.clock()
+        deadline = now + delay
+        tick = max(self._to_tick(deadline), self._tick)
+        timer = Timer(self, deadline, tick, callback)
+        self._slots[tick % len(self._slots)].append(timer)
+        self.pending += 1
+        if self._next is not None:
+            self._next = min(self._next, deadline)
+        return timer
+
+    def advance(self, now=None):
+        """Fire all timers due at `now`; returns how many fired."""
+        if now is None:
+            now = self.clock()
+        now_tick = self._to_tick(now)
+        if self._next is not None and now >= self._next:
+            self._next = None
+        if self.pending == 0:
+            self._tick = max(self._tick, now_tick)
+            return 0
+
+        fired = 0
+        # Always includes the current bucket: a timer scheduled into it may be due already
+        last = min(max(now_tick, self._tick), self._tick + len(self._slots) - 1)
+        for tick in range(self._tick, last + 1):
+            slot = self._slots[tick % len(self._slots)]
+            if not slot:
+                continue
+            due = []
+            keep = []
+            for timer in slot:
+                if not timer.active:
+                    continue
+                if timer.deadline <= now:
+                    due.append(timer)
+                else:
+                    keep.append(timer)  # later in this bucket, or a later lap of the wheel
+            slot[:] = keep
+            for timer in sorted(due, key=lambda t: t.deadline):
+                if timer.active:  # an earlier callback may have cancelled it
+                    timer.active = False
+                    self.pending -= 1
+                    self.fired += 1
+                    fired += 1
+                    timer.callback()
+        # The current bucket may still hold timers due later in it, so it is revisited next time
+        self._tick = max(self._tick, now_tick)
+        return fired
+
+    def next_deadline(self):
+        """Earliest pending deadline within one lap of the wheel.
+
+        Returns the end of the lap if every pending timer is further out, and
+        None if nothing is pending. The answer is cached until a timer fires
+        or an earlier one is scheduled, so it costs at most one pass over the
+        buckets per firing; after a cancel it may be early (a wake-up with
+        nothing to fire).
+        """
+        if self.pending == 0:
+            return None
+        if self._next is not None:
+            return self._next
+        slots = self._slots
+        lap = len(slots)
+        for tick in range(self._tick, self._tick + lap):
+            slot = slots[tick % lap]
+            if not slot:
+                continue
+            deadlines = [timer.deadline for timer in slot if timer.active and timer.tick <= tick]
+            if deadlines:
+                self._next = min(deadlines)
+                return self._next
+        self._next = (self._tick + lap) * self.resolution
+        return self._next
@@ -0,0 +1,194 @@
+"""Stand-in for the robot's Arduino (arduino.ino) on a pseudo-terminal.
+
+Speaks the same line protocol as the sketch: "<seq> <COMMAND>" frames answered
+with "ACK <seq>"/"NACK <seq>" before the command runs, bare commands without a
+reply, CHECK_LOCATION answered with the current location, and RFID reads sent
+as BLUE/PURPLE/YELLOW lines. Point anything that takes a serial port at
+`VirtualArduino().port` (or run this file and use the printed path) to work on
+the interaction code without the hardware:
+
+    python virtual_arduino.py --latency 2 --script 5:BLUE,40:PURPLE,70:BLUE
+    NOMO_SERIAL_PORT=/dev/pts/5 python piarduino_merge.py
+"""
+
+import argparse
+import os
+import threading
+import time
+import tty
+
+# Commands the sketch knows (KNOWN_COMMANDS in arduino.ino)
+KNOWN_COMMANDS = (
+    "PING", "SHY", "NEUTRAL", "LOOKUP", "LOOKDOWN", "EXTEND_STUDY", "EXTEND_BREAK",
+    "MOVE_TO_DESK", "BREAK_YELLOW", "BREAK_PURPLE", "CHECK_LOCATION", "SECOND_BREAK_NUDGE",
+    "BACK_TO_STUDY", "STUDY_RESTART", "SECOND_STUDY_NUDGE", "STANDBY", "LOOK_LEFT",
+    "LOOK_RIGHT", "DETECTED", "WAVE", "STUDY",
+)
+
+# How long the sketch's loop() is stuck in a blocking servo routine after a command
+BLOCKING_SECONDS = {
+    "STUDY": 0.6, "EXTEND_STUDY": 0.6, "EXTEND_BREAK": 0.6,  # knod(): 2 steps x 300 ms
+    "DETECTED": 0.9, "WAVE": 0.9,  # faceWave(): 3 steps x 300 ms
+}
+
+
+class VirtualArduino:
+    """Emulates the sketch's serial behaviour and the state the Pi cares about.
+
+    latency: seconds before each reply line is written (USB + loop() delay).
+    simulate_blocking: also stall after knod()/faceWave() commands like the
+    real board does, which delays the ACK of whatever comes next.
+    """
+
+    def __init__(self, latency=0.0, simulate_blocking=True):
+        self.latency = latency
+        self.simulate_blocking = simulate_blocking
+
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+
+        self._write_lock = threading.Lock()
+        self._running = False
+        self._threads = []
+
+        # Sketch state
+        self.study_mode = False
+        self.break_location = ""
+        self.current_location = ""
+        self.bottom_servo = 70
+        self.up_servo = 90
+        self._last_card = None
+
+        self.commands = []  # (time.monotonic(), seq or None, command) in arrival order
+        self.unknown_commands = []
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._spawn(self._serve, "VirtualArduino")
+        return self
+
+    def stop(self):
+        self._running = False
+        os.close(self._master)
+        os.close(self._slave)
+
+    def set_location(self, location):
+        """Simulate an RFID card read (BLUE, PURPLE or YELLOW; anything else is an unknown card)."""
+        if location == self._last_card:
+            return  # the sketch ignores the card it read last
+        self._last_card = location
+        if location in ("BLUE", "PURPLE", "YELLOW"):
+            self.current_location = location
+            self._write_line(location)
+        else:
+            self.current_location = "NONE"
+
+    def script(self, steps):
+        """Replay (seconds_from_now, location) card reads on a background thread."""
+        def run():
+            start = time.monotonic()
+            for at, location in sorted(steps):
+                time.sleep(max(0.0, start + at - time.monotonic()))
+                if not self._running:
+                    return
+                self.set_location(location)
+        self._spawn(run, "VirtualArduinoScript")
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _write_line(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._write_lock:
+            os.write(self._master, f"{text}\r\n".encode())
+
+    def _serve(self):
+        partial = b''
+        while self._running:
+            try:
+                data = os.read(self._master, 1024)
+            except OSError:
+                return  # stopped
+            partial += data
+            *lines, partial = partial.split(b'\n')
+            for line in lines:
+                self._handle_line(line.decode(errors='replace').strip())
+
+    def _handle_line(self, line):
+        if not line:
+            return
+        command, seq = line, None
+        head, _, rest = line.partition(' ')
+        if rest and head.isdigit():
+            seq, command = int(head), rest.strip()
+        self.commands.append((time.monotonic(), seq, command))
+
+        known = command in KNOWN_COMMANDS
+        if seq is not None:
+            self._write_line(f"{'ACK' if known else 'NACK'} {seq}")
+        if not known:
+            self.unknown_commands.append(command)
+            return
+        self._execute(command)
+        if self.simulate_blocking:
+            time.sleep(BLOCKING_SECONDS.get(command, 0.0))
+
+    def _execute(self, command):
+        if command == "CHECK_LOCATION":
+            self._write_line(self.current_location)
+        elif command == "STUDY":
+            self.study_mode = True
+        elif command == "STANDBY":
+            self.study_mode = False
+            self.break_location = ""
+        elif command in ("BREAK_YELLOW", "BREAK_PURPLE"):
+            self.break_location = command.split("_")[1]
+        elif command == "STUDY_RESTART":
+            self.break_location = ""
+        elif command == "NEUTRAL":
+            self.bottom_servo, self.up_servo = 70, 90
+        elif command == "LOOK_LEFT":
+            self.bottom_servo = 95
+        elif command == "LOOK_RIGHT":
+            self.bottom_servo = 55
+
+
+def parse_script(text):
+    steps = []
+    for item in filter(None, text.split(",")):
+        at, location = item.split(":")
+        steps.append((float(at), location.strip().upper()))
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.0, help='Reply latency in milliseconds.')
+    parser.add_argument('--noBlocking', action='store_true',
+                        help='Do not stall after knod()/faceWave() commands.')
+    parser.add_argument('--script', default='',
+                        help='RFID reads as seconds:LOCATION pairs, e.g. 5:BLUE,40:PURPLE.')
+    args = parser.parse_args()
+
+    board = VirtualArduino(latency=args.latency / 1000, simulate_blocking=not args.noBlocking).start()
+    board.script(parse_script(args.script))
+    print(f"Virtual Arduino on {board.port} (Ctrl-C to stop)")
+
+    seen = 0
+    try:
+        while True:
+            time.sleep(0.1)
+            for _, seq, command in board.commands[seen:]:
+                print(f"Received: {command}" + (f" (seq {seq})" if seq is not None else ""))
+            seen = len(board.commands)
+    except KeyboardInterrupt:
+        board.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -80,6 +80,7 @@ const byte trackUIDs[3][4] = {
 
 void setup() {
     Serial.begin(115200);
+    Serial.setTimeout(20);  // Only guards against a frame cut off before its newline
     // while (!Serial);
 
     if (!capTouch.begin(0x5A)) {
@@ -128,13 +129,63 @@ void loop() {
       updateBlinking();
       updateFadeEffect(); // Run fading effect
     }
-    String command = "";
-  if (Serial.available() > 0) {
-    command = Serial.readStringUntil('\n');  // Read full command until newline
-    command.trim();  // Remove extra whitespace or newline characters
+    handleSerial();
+}
+
+
+//////////////////////////////////////////////////////////
+// CODE FOR SERIAL COMMANDS
+//////////////////////////////////////////////////////////
+
+// Commands from the Pi arrive as "<seq> <COMMAND>\n". Each one is answered with
+// "ACK <seq>" (known command) or "NACK <seq>" before it runs, so the Pi knows it
+// arrived and can time the round trip. A bare "<COMMAND>\n" still works, without a reply.
+// Location lines (BLUE/PURPLE/YELLOW) are still sent on their own.
+const char* const KNOWN_COMMANDS[] = {
+    "PING", "SHY", "NEUTRAL", "LOOKUP", "LOOKDOWN", "EXTEND_STUDY", "EXTEND_BREAK",
+    "MOVE_TO_DESK", "BREAK_YELLOW", "BREAK_PURPLE", "CHECK_LOCATION", "SECOND_BREAK_NUDGE",
+    "BACK_TO_STUDY", "STUDY_RESTART", "SECOND_STUDY_NUDGE", "STANDBY", "LOOK_LEFT",
+    "LOOK_RIGHT", "DETECTED", "WAVE", "STUDY"
+};
+
+void handleSerial() {
+  if (Serial.available() <= 0) return;
+
+  String line = Serial.readStringUntil('\n');  // Returns as soon as the newline arrives
+  line.trim();
+  if (line.length() == 0) return;
+
+  // Split off the sequence number, if there is one
+  String command = line;
+  long seq = -1;
+  int space = line.indexOf(' ');
+  if (space > 0 && isDigit(line.charAt(0))) {
+    seq = line.substring(0, space).toInt();
+    command = line.substring(space + 1);
+    command.trim();
   }
 
-  if (command == "SHY"){
+  bool known = isKnownCommand(command);
+  if (seq >= 0) {
+    Serial.print(known ? "ACK " : "NACK ");
+    Serial.println(seq);
+  }
+  if (known) {
+    executeCommand(command);
+  }
+}
+
+bool isKnownCommand(const String& command) {
+  for (unsigned int i = 0; i < sizeof(KNOWN_COMMANDS) / sizeof(KNOWN_COMMANDS[0]); i++) {
+    if (command == KNOWN_COMMANDS[i]) return true;
+  }
+  return false;
+}
+
+void executeCommand(const String& command) {
+  if (command == "PING"){
+    // Round-trip check, the ACK is the whole reply
+  } else if (command == "SHY"){
     // servo move down 
     myDFPlayer.stop(); 
     myDFPlayer.play(1);